@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, Response
+from ..core.profiling import profile_dir
+import io
+import re
+import zipfile
+
+router = APIRouter()
+
+# Files a saved profile may contain, by download format
+PROFILE_FILES = {
+    "trace": ("trace.json", "application/json"),
+    "pstats": ("profile.pstats", "application/octet-stream"),
+    "text": ("profile.txt", "text/plain"),
+}
+
+
+@router.get("/jobs/{job_id}/profile")
+def download_profile(job_id: str, format: str = "zip"):
+    """Download the profile of a job started with profile=true.
+
+    Parameters:
+    - job_id: Id returned by /api/upload or /api/filter_tables
+    - format: "zip" (everything), "trace" (Chrome trace JSON), "pstats" (cProfile dump) or "text" (summary)
+    """
+    if not re.fullmatch(r"[0-9a-f]{1,32}", job_id):
+        raise HTTPException(status_code=400, detail="Invalid job id")
+    directory = profile_dir(job_id)
+    if not directory.is_dir():
+        raise HTTPException(status_code=404, detail=f"No profile found for job: {job_id}")
+
+    if format == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, _ in PROFILE_FILES.values():
+                path = directory / name
+                if path.is_file():
+                    zf.write(path, arcname=name)
+        return Response(
+            buffer.getvalue(),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="profile_{job_id}.zip"'},
+        )
+
+    if format not in PROFILE_FILES:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    name, media_type = PROFILE_FILES[format]
+    path = directory / name
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"No {format} profile for job: {job_id}")
+    return FileResponse(path, filename=f"{job_id}_{name}", media_type=media_type)
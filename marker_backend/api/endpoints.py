@@ -1,46 +1,65 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException    
-from fastapi.responses import FileResponse    
-from ..core.logger import get_logger    
-from ..core.config import ensure_dirs, UPLOADS_DIR, OUTPUTS_DIR, FILTERS_DIR  
+from fastapi.responses import FileResponse, Response    
+from ..core.logger import get_logger, log_context    
+from ..core.profiling import profile_job, span, thread_profiler
+from ..core.config import ensure_dirs, UPLOADS_DIR, OUTPUTS_DIR, FILTERS_DIR, PDF2IMAGE_DIR, PREPROCESS_ENABLED  
 from ..services.file_handler import save_upload    
 from ..services.marker_runner import run_marker_for_chunk    
-from ..services.pdf_converter import convert_pdf_and_process
-from ..models.schemas import UploadResponse, TableExtractionResponse    
+from ..services.pdf_converter import convert_pdf_and_process, convert_image_and_process
+from ..services.image_splitter import needs_splitting
+from ..services.active_jobs import active_jobs
+from ..services.page_store import PageStore, read_page_range
+from ..services.image_preprocessor import preprocess_image
+from ..services.search_index import search_index
+from ..core.metrics import metrics
+from ..models.schemas import UploadResponse, TableExtractionResponse, SearchResponse    
 from ..core.exceptions import InvalidFileError, MarkerError  # Removed ChunkingError  
 from pathlib import Path
+from typing import Optional
+import mimetypes
+import shutil
 import time    
+import uuid
     
 router = APIRouter()    
 logger = get_logger(__name__)    
     
     
 @router.post("/upload", response_model=UploadResponse)    
-async def upload_pdf(file: UploadFile = File(...)):    
+async def upload_pdf(file: UploadFile = File(...), full_output: bool = False, profile: bool = False):    
     """Upload a PDF or image and process it with marker.
     
     For PDFs: Converts to images, processes each page with marker_single, combines output.
-    For images: Processes directly with marker_single.
+    For multi-page TIFFs and very tall images: Splits into frames/tiles and proceeds like a PDF.
+    For other images: Preprocesses (crop/deskew/downscale) and processes with marker_single.
+    With full_output=true the complete Marker stdout/stderr is kept under logs/jobs/<job_id>/.
+    With profile=true a stage timeline and cProfile are collected; fetch them from
+    /debug/jobs/<job_id>/profile.
     """
     ensure_dirs()    
     start = time.time()    
+    job_id = uuid.uuid4().hex[:12]
+    # Timeline only on the event loop; the synchronous conversion is cProfiled in _handle_upload
+    with log_context(job_id=job_id, stage="upload", full_output=full_output), profile_job(
+        job_id, profile, cprofile=False
+    ):
+        response = await _handle_upload(file, start)
+    response.job_id = job_id
+    return response
+
+
+async def _handle_upload(file: UploadFile, start: float) -> UploadResponse:
+    # Keep the janitor away from this job's upload and output folder while it runs
+    upload_name = Path(file.filename or "upload")
+    job_paths = (UPLOADS_DIR / upload_name.name, OUTPUTS_DIR / upload_name.stem)
+    active_jobs.acquire(*job_paths)
     try:    
         saved_path = await save_upload(file)    
         logger.info(f"Saved upload to {saved_path}")
         
-        # Check file type
-        file_suffix = saved_path.suffix.lower()
-        
-        if file_suffix == ".pdf":
-            # Use PDF converter workflow for PDFs
-            logger.info(f"PDF detected, using conversion workflow: {saved_path}")
-            output = convert_pdf_and_process(saved_path, output_dir=OUTPUTS_DIR, keep_images=False)
-        else:
-            # Direct processing for images - organize by filename in outputs
-            logger.info(f"Image detected, processing directly with marker_single: {saved_path}")
-            # Create a directory for this image's output (similar to PDF structure)
-            img_output_dir = OUTPUTS_DIR / saved_path.stem
-            img_output_dir.mkdir(parents=True, exist_ok=True)
-            output = run_marker_for_chunk(saved_path, output_dir=img_output_dir)
+        # No await below: the profiler only sees this job's work
+        with thread_profiler():
+            output = _convert_upload(saved_path)
         
         logger.info(f"Processing produced output file: {output}")    
     
@@ -65,6 +84,53 @@ async def upload_pdf(file: UploadFile = File(...)):
     except Exception as e:    
         logger.exception("Unexpected error processing upload")    
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        active_jobs.release(*job_paths)
+
+
+def _convert_upload(saved_path: Path) -> Path:
+    """Convert a saved upload to markdown; returns the output path."""
+    # Check file type
+    file_suffix = saved_path.suffix.lower()
+    
+    if file_suffix == ".pdf":
+        # Use PDF converter workflow for PDFs
+        logger.info(f"PDF detected, using conversion workflow: {saved_path}")
+        return convert_pdf_and_process(saved_path, output_dir=OUTPUTS_DIR, keep_images=False)
+    if needs_splitting(saved_path):
+        # Multi-page TIFFs and very tall images go through the per-page pipeline
+        logger.info(f"Multi-frame or tall image detected, splitting into pages: {saved_path}")
+        return convert_image_and_process(saved_path, output_dir=OUTPUTS_DIR, keep_images=False)
+    # Direct processing for images - organize by filename in outputs
+    logger.info(f"Image detected, processing directly with marker_single: {saved_path}")
+    # Create a directory for this image's output (similar to PDF structure)
+    img_output_dir = OUTPUTS_DIR / saved_path.stem
+    img_output_dir.mkdir(parents=True, exist_ok=True)
+    output = _run_marker_on_image(saved_path, img_output_dir)
+    search_index.index_page(img_output_dir.name, 1, Path(output).read_text(encoding="utf-8"))
+    return output
+
+
+def _run_marker_on_image(image_path: Path, output_dir: Path) -> Path:
+    """Run Marker on an uploaded image, on a preprocessed copy when preprocessing is enabled."""
+    if not PREPROCESS_ENABLED:
+        return run_marker_for_chunk(image_path, output_dir=output_dir)
+
+    # Same file name in its own folder so Marker's output folder keeps the upload's stem
+    prep_dir = PDF2IMAGE_DIR / f"{image_path.stem}_prep"
+    with active_jobs.track(prep_dir), log_context(stage="preprocess"), span("preprocess"):
+        try:
+            prep = preprocess_image(image_path, prep_dir / f"{image_path.stem}.png")
+        except Exception as e:
+            logger.warning(f"Preprocessing failed for {image_path.name}, using original: {e}")
+            metrics.inc("preprocess.failures")
+            prep = None
+    source = prep.path if prep is not None else image_path
+    try:
+        with active_jobs.track(prep_dir), log_context(stage="marker"):
+            return run_marker_for_chunk(source, output_dir=output_dir)
+    finally:
+        shutil.rmtree(prep_dir, ignore_errors=True)
     
 # @router.get("/download/{filename:path}")    
 # def download(filename: str):    
@@ -114,6 +180,18 @@ def download(filename: str):
         logger.info(f"Found markdown at direct path: {direct_path}")
         return FileResponse(direct_path, filename=direct_path.name, media_type="text/markdown")
     
+    # Strategy 4: Combined file missing but per-page output kept in the page store
+    store = PageStore.open_for_document(OUTPUTS_DIR / doc_name, doc_name)
+    if store is not None:
+        with store:
+            content = "".join(f"## Page {page}\n\n{markdown}\n\n---\n\n" for page, markdown in store.iter_markdown())
+        logger.info(f"Assembled markdown for {doc_name} from page store")
+        return Response(
+            content,
+            media_type="text/markdown",
+            headers={"Content-Disposition": f'attachment; filename="{doc_name}.md"'},
+        )
+
     # Log available directories for debugging
     logger.warning(f"Markdown file not found for document: {doc_name}")
     try:
@@ -126,29 +204,56 @@ def download(filename: str):
 
 
 @router.post("/filter_tables", response_model=TableExtractionResponse)
-async def filter_tables(document: str, sheets_per_file: int = 30, store_in_filters: bool = False):
+async def filter_tables(
+    document: str,
+    sheets_per_file: int = 30,
+    store_in_filters: bool = False,
+    start_page: Optional[int] = None,
+    end_page: Optional[int] = None,
+    profile: bool = False,
+):
     """Extract tables from a processed document's markdown and save Excel batches.
 
     Expects marker output folder structure: outputs/<document>/<document>.md
+    With start_page/end_page only that page range is read (from the page store or page folders).
+    With profile=true the extraction is profiled (see /debug/jobs/<job_id>/profile).
     Returns metadata including created Excel files.
     """
     ensure_dirs()
     start = time.time()
+    job_id = uuid.uuid4().hex[:12]
+    with log_context(job_id=job_id, stage="tables"), profile_job(job_id, profile, cprofile=False):
+        with thread_profiler():
+            response = _extract_tables(document, sheets_per_file, store_in_filters, start_page, end_page)
+    response.job_id = job_id
+    return response
+
+
+def _extract_tables(
+    document: str,
+    sheets_per_file: int,
+    store_in_filters: bool,
+    start_page: Optional[int],
+    end_page: Optional[int],
+) -> TableExtractionResponse:
     try:
         from ..services.table_extractor import extract_and_save_tables
         excel_base_dir = FILTERS_DIR if store_in_filters else None
-        md_path, dfs, excel_files, excel_folder = extract_and_save_tables(
-            document,
-            OUTPUTS_DIR,
-            sheets_per_file=sheets_per_file,
-            excel_base_dir=excel_base_dir,
-        )
-        logger.info(f"Extracted {len(dfs)} tables for document '{document}' into {excel_folder}")
+        with active_jobs.track(OUTPUTS_DIR / document, FILTERS_DIR / document), span("tables", document=document):
+            md_path, tables_count, excel_files, excel_folder = extract_and_save_tables(
+                document,
+                OUTPUTS_DIR,
+                sheets_per_file=sheets_per_file,
+                excel_base_dir=excel_base_dir,
+                start_page=start_page,
+                end_page=end_page,
+            )
+        logger.info(f"Extracted {tables_count} tables for document '{document}' into {excel_folder}")
         return TableExtractionResponse(
             status="success",
             document=document,
             markdown_path=str(md_path),
-            tables_count=len(dfs),
+            tables_count=tables_count,
             excel_folder=str(excel_folder),
             excel_files=[str(p) for p in excel_files],
         )
@@ -191,3 +296,73 @@ def download_table(document: str, filename: str, store_in_filters: bool = False)
         filename=path.name,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
+
+
+@router.get("/pages/{document}")
+def get_pages(document: str, start: int = 1, end: Optional[int] = None):
+    """Return the markdown of a page range of a processed PDF.
+
+    Pages are read from the document's page store (PAGE_STORE=sqlite) or its per-page folders.
+    """
+    if start < 1 or (end is not None and end < start):
+        raise HTTPException(status_code=400, detail="Invalid page range")
+    pages = read_page_range(OUTPUTS_DIR / document, document, start, end)
+    if not pages:
+        raise HTTPException(status_code=404, detail=f"No processed pages found for document: {document}")
+    content = "".join(f"## Page {page}\n\n{markdown}\n\n---\n\n" for page, markdown in pages)
+    return Response(content, media_type="text/markdown")
+
+
+@router.get("/pages/{document}/{page}/assets/{name:path}")
+def get_page_asset(document: str, page: int, name: str):
+    """Return an image extracted by Marker for one page of a processed PDF."""
+    if ".." in Path(name).parts:
+        raise HTTPException(status_code=400, detail="Invalid asset name")
+    store = PageStore.open_for_document(OUTPUTS_DIR / document, document)
+    if store is not None:
+        with store:
+            data = store.get_asset(page, name)
+    else:
+        asset_path = OUTPUTS_DIR / document / f"{document}_page_{page:04d}" / name
+        data = asset_path.read_bytes() if asset_path.is_file() else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Response(data, media_type=media_type)
+
+
+@router.get("/search", response_model=SearchResponse)
+def search(q: str, limit: int = 20, document: Optional[str] = None, tables: bool = True):
+    """Full-text search over processed documents.
+
+    Parameters:
+    - q: Search terms (all must match)
+    - limit: Maximum hits per result list
+    - document: Restrict the search to one document
+    - tables: Also search individual table cells
+
+    Returns:
+    - Page hits (document, page, snippet) and, optionally, table cell hits
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Empty search query")
+    if not search_index.available:
+        raise HTTPException(status_code=503, detail="Search index is not available")
+    limit = max(1, min(limit, 200))
+    start = time.perf_counter()
+    hits = search_index.search(q, limit=limit, document=document)
+    table_hits = search_index.search_tables(q, limit=limit, document=document) if tables else []
+    elapsed = time.perf_counter() - start
+    metrics.observe("search.request_seconds", elapsed)
+    return SearchResponse(
+        query=q,
+        hits=hits,
+        table_hits=table_hits,
+        query_time_ms=round(elapsed * 1000, 2),
+    )
+
+
+@router.get("/metrics")
+def get_metrics():
+    """Return in-process service metrics (counters, gauges and timing percentiles)."""
+    return metrics.snapshot()
@@ -1,4 +1,5 @@
 from pathlib import Path
+import json
 import os
 
 # Server configuration
@@ -7,12 +8,14 @@ PORT = int(os.environ.get("PORT", 8000))
 
 # Base paths
 BASE_DIR = Path(__file__).resolve().parents[2]
-TEMP_DIR = BASE_DIR / "temp"
+TEMP_DIR = Path(os.environ.get("TEMP_DIR", BASE_DIR / "temp"))
 UPLOADS_DIR = TEMP_DIR / "uploads"
 OUTPUTS_DIR = TEMP_DIR / "outputs"
 FILTERS_DIR = TEMP_DIR / "filters"
 PDF2IMAGE_DIR = TEMP_DIR / "pdf2image"
-LOGS_DIR = BASE_DIR / "logs"
+# Small persistent service state (learned tuning values, indexes, journals)
+STATE_DIR = TEMP_DIR / "state"
+LOGS_DIR = Path(os.environ.get("LOGS_DIR", BASE_DIR / "logs"))
 
 # Marker CLI configuration
 # Set to the marker CLI/binary you have installed, e.g. "marker_single" or full path
@@ -21,9 +24,136 @@ MARKER_CLI = os.environ.get("MARKER_CLI", "marker_single")
 # Note: --output_dir is set dynamically per marker run, so don't include it here
 MARKER_FLAGS = os.environ.get("MARKER_FLAGS", "--force_ocr --output_format markdown").split()
 OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "markdown")
+# Base Marker settings (batch sizes, table limits) passed via --config_json
+MARKER_CONFIG_JSON = Path(os.environ.get("MARKER_CONFIG_JSON", BASE_DIR / "marker_config.json"))
+
+# Adaptive batch sizing: scale the *_batch_size values in MARKER_CONFIG_JSON to the
+# free memory of the GPU, halve on CUDA OOM and grow back after successful runs.
+ADAPTIVE_BATCH_SIZING = os.environ.get("ADAPTIVE_BATCH_SIZING", "1") == "1"
+# Free memory (MB) at which the batch sizes in MARKER_CONFIG_JSON are used unscaled
+BATCH_REFERENCE_FREE_MB = int(os.environ.get("BATCH_REFERENCE_FREE_MB", 16000))
+BATCH_OOM_MAX_RETRIES = int(os.environ.get("BATCH_OOM_MAX_RETRIES", 4))
+# Number of consecutive successful runs before trying larger batches again
+BATCH_GROW_AFTER_SUCCESSES = int(os.environ.get("BATCH_GROW_AFTER_SUCCESSES", 5))
+BATCH_GROW_FACTOR = float(os.environ.get("BATCH_GROW_FACTOR", 1.25))
+# Successful runs without an OOM after which the learned ceiling is forgotten
+BATCH_CEILING_RESET_SUCCESSES = int(os.environ.get("BATCH_CEILING_RESET_SUCCESSES", 200))
+BATCH_MIN_SCALE = float(os.environ.get("BATCH_MIN_SCALE", 1 / 32))
+BATCH_TUNING_FILE = STATE_DIR / "batch_tuning.json"
+
+# Per-page routing: classify each PDF page and run it with a named Marker profile.
+# Blank pages are skipped; pages whose text layer shows neither a ruled grid nor
+# column-aligned rows use the cheaper "text" profile, which leaves out Marker's table
+# recognition processors (the most expensive stage). Everything else runs "full".
+# Off by default: a missed table loses its structure, so enable it per deployment.
+PAGE_ROUTING = os.environ.get("PAGE_ROUTING", "0") == "1"
+PAGE_BLANK_INK_RATIO = float(os.environ.get("PAGE_BLANK_INK_RATIO", 0.002))
+PAGE_TABLE_MIN_HLINES = int(os.environ.get("PAGE_TABLE_MIN_HLINES", 3))
+PAGE_TABLE_MIN_VLINES = int(os.environ.get("PAGE_TABLE_MIN_VLINES", 2))
+# Text rows split into 3+ columns by wide gaps that mark a page as a (borderless) table
+PAGE_TABLE_MIN_ALIGNED_ROWS = int(os.environ.get("PAGE_TABLE_MIN_ALIGNED_ROWS", 3))
+# Profiles map a name to Marker flags, config overrides (merged into MARKER_CONFIG_JSON) and
+# Marker processor classes to leave out of its default pipeline (by class name).
+# Override with a JSON file of the same shape via MARKER_PROFILES_JSON.
+TABLE_PROCESSORS = ["TableProcessor", "LLMTableProcessor", "LLMTableMergeProcessor"]
+MARKER_PROFILES = {
+    "full": {"flags": MARKER_FLAGS, "config": {}, "skip_processors": []},
+    "text": {"flags": MARKER_FLAGS, "config": {}, "skip_processors": TABLE_PROCESSORS},
+}
+if os.environ.get("MARKER_PROFILES_JSON"):
+    with open(os.environ["MARKER_PROFILES_JSON"], "r", encoding="utf-8") as _f:
+        for _name, _profile in json.load(_f).items():
+            _flags = _profile.get("flags", MARKER_FLAGS)
+            MARKER_PROFILES[_name] = {
+                "flags": _flags.split() if isinstance(_flags, str) else list(_flags),
+                "config": dict(_profile.get("config", {})),
+                "skip_processors": list(_profile.get("skip_processors", [])),
+            }
+
+# Image preprocessing before OCR (crop, deskew, downscale, optional binarization).
+# Off by default: it changes the pixels Marker sees, so enable it per deployment
+PREPROCESS_ENABLED = os.environ.get("PREPROCESS_ENABLED", "0") == "1"
+PREPROCESS_TARGET_LINE_HEIGHT = int(os.environ.get("PREPROCESS_TARGET_LINE_HEIGHT", 40))
+PREPROCESS_MAX_SKEW_DEG = float(os.environ.get("PREPROCESS_MAX_SKEW_DEG", 5))
+# Hard cap on pixels per image after preprocessing (0 disables)
+PREPROCESS_MAX_PIXELS = int(os.environ.get("PREPROCESS_MAX_PIXELS", 12_000_000))
+PREPROCESS_BINARIZE = os.environ.get("PREPROCESS_BINARIZE", "0") == "1"
+
+# Page handoff between rendering and Marker: "disk" saves PNGs in PDF2IMAGE_DIR at render
+# time; "shm" keeps raw pixels in shared memory and writes a single PNG to HANDOFF_DIR
+# (tmpfs) only when the Marker CLI needs it. HANDOFF_MAX_BYTES bounds shared memory use.
+PAGE_HANDOFF = os.environ.get("PAGE_HANDOFF", "disk").lower()
+HANDOFF_DIR = Path(
+    os.environ.get("HANDOFF_DIR")
+    or (Path("/dev/shm") / "marker_backend" if Path("/dev/shm").is_dir() else PDF2IMAGE_DIR)
+)
+HANDOFF_MAX_BYTES = int(os.environ.get("HANDOFF_MAX_BYTES", 1024 * 1024 * 1024))
+# Free space always left in /dev/shm; the budget is capped by what is actually free there
+# (a shared memory block larger than the free space crashes the process with SIGBUS on write)
+HANDOFF_SHM_RESERVE_BYTES = int(os.environ.get("HANDOFF_SHM_RESERVE_BYTES", 32 * 1024 * 1024))
+
+# Pages of one document processed concurrently (each page is a separate Marker run).
+# On CPU-only hosts with the CPU planner active, it is capped at the planned workers.
+PAGE_WORKERS = int(os.environ.get("PAGE_WORKERS", 1))
+
+# CPU execution planner: on hosts without a GPU the cores are split among concurrent
+# Marker processes (OMP/MKL thread counts, optional affinity). "auto" enables it when
+# no GPU is found, "1"/"0" force it on/off
+CPU_PLANNER = os.environ.get("CPU_PLANNER", "auto").lower()
+# Concurrent Marker processes; 0 takes the calibrated value, else CPU_DEFAULT_THREADS per worker
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", 0))
+CPU_DEFAULT_THREADS = int(os.environ.get("CPU_DEFAULT_THREADS", 4))
+CPU_AFFINITY = os.environ.get("CPU_AFFINITY", "0") == "1"
+CPU_CALIBRATION_FILE = STATE_DIR / "cpu_calibration.json"
+
+# Tall images (long screenshots, scrolls) are cut into tiles when taller than
+# TILE_MAX_ASPECT x width and TILE_MIN_HEIGHT px; tiles are ~TILE_HEIGHT_RATIO x width
+TILE_MAX_ASPECT = float(os.environ.get("TILE_MAX_ASPECT", 3.0))
+TILE_MIN_HEIGHT = int(os.environ.get("TILE_MIN_HEIGHT", 4000))
+TILE_HEIGHT_RATIO = float(os.environ.get("TILE_HEIGHT_RATIO", 1.414))
+
+# Straggler hedging (PAGE_WORKERS > 1): a page running longer than the document's running
+# p95 page time (x HEDGE_P95_MULTIPLIER, at least HEDGE_MIN_SECONDS) is launched again on an
+# idle worker, optionally with a cheaper profile and/or downscaled image; the first result wins
+PAGE_HEDGING = os.environ.get("PAGE_HEDGING", "1") == "1"
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 4))
+HEDGE_P95_MULTIPLIER = float(os.environ.get("HEDGE_P95_MULTIPLIER", 1.0))
+HEDGE_MIN_SECONDS = float(os.environ.get("HEDGE_MIN_SECONDS", 10))
+HEDGE_PROFILE = os.environ.get("HEDGE_PROFILE", "")  # MARKER_PROFILES name; empty: same as the page
+HEDGE_SCALE = float(os.environ.get("HEDGE_SCALE", 1.0))  # < 1 lowers the effective DPI
+HEDGE_POLL_SEC = float(os.environ.get("HEDGE_POLL_SEC", 0.5))
+
+# Per-page Marker output storage: "dirs" keeps one folder per page, "sqlite" packs
+# every page's markdown, metadata and images into OUTPUTS_DIR/<doc>/<doc>.pages.sqlite
+PAGE_STORE = os.environ.get("PAGE_STORE", "dirs").lower()
+PAGE_STORE_MMAP_BYTES = int(os.environ.get("PAGE_STORE_MMAP_BYTES", 256 * 1024 * 1024))
+
+# Full-text search (SQLite FTS5) over converted pages and table cells, updated as pages finish
+SEARCH_ENABLED = os.environ.get("SEARCH_ENABLED", "1") == "1"
+SEARCH_INDEX_PATH = Path(os.environ.get("SEARCH_INDEX_PATH", STATE_DIR / "search.sqlite"))
+
+# Write-ahead journal of conversion jobs; unfinished jobs are resumed on startup
+JOB_JOURNAL_ENABLED = os.environ.get("JOB_JOURNAL", "1") == "1"
+JOB_JOURNAL_PATH = Path(os.environ.get("JOB_JOURNAL_PATH", STATE_DIR / "jobs.sqlite"))
+JOB_RESUME_ON_STARTUP = os.environ.get("JOB_RESUME_ON_STARTUP", "1") == "1"
+# A job that keeps taking the process down is given up after this many runs
+JOB_RESUME_MAX_ATTEMPTS = int(os.environ.get("JOB_RESUME_MAX_ATTEMPTS", 3))
+JOB_JOURNAL_MAX_AGE_HOURS = float(os.environ.get("JOB_JOURNAL_MAX_AGE_HOURS", 168))
+# A running job is owned by one process, which renews its lease every JOB_LEASE_SEC / 3;
+# other processes (uvicorn workers, an overlapping restart) only take over expired leases
+JOB_LEASE_SEC = float(os.environ.get("JOB_LEASE_SEC", 60))
 
 # Logging
 LOG_FILE = LOGS_DIR / "app.log"
+# app.log record format: "json" (one object per line with job_id/page/stage) or "text"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_CONSOLE_LEVEL = os.environ.get("LOG_CONSOLE_LEVEL", "INFO").upper()
+# Records are handed to a background writer through a bounded queue and dropped when it is full
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Marker stdout/stderr longer than this is logged as head + tail only
+LOG_SUBPROCESS_MAX_CHARS = int(os.environ.get("LOG_SUBPROCESS_MAX_CHARS", 4000))
+# Full Marker output of jobs uploaded with full_output=true is kept here per job id
+JOB_LOGS_DIR = LOGS_DIR / "jobs"
 
 # GPU safety thresholds (degrees C and free memory in MB)
 GPU_TEMP_THRESHOLD_C = int(os.environ.get("GPU_TEMP_THRESHOLD_C", 85))
@@ -34,6 +164,34 @@ GPU_POLL_INTERVAL_SEC = int(os.environ.get("GPU_POLL_INTERVAL_SEC", 5))
 # Allowed upload extensions (include common image types)
 ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".tiff", ".tif", ".bmp"}
 
+# Temp tree retention, enforced by the background janitor. For each directory the
+# limits can be set with <NAME>_MAX_AGE_HOURS, <NAME>_MAX_BYTES and <NAME>_MAX_ENTRIES
+# where NAME is UPLOADS, OUTPUTS, PDF2IMAGE, FILTERS, JOB_LOGS or HANDOFF. 0 disables a limit.
+# Converted documents (OUTPUTS) and extracted tables (FILTERS) are results, not scratch,
+# so they are kept until a limit is configured for them.
+JANITOR_ENABLED = os.environ.get("JANITOR_ENABLED", "1") == "1"
+JANITOR_INTERVAL_SEC = int(os.environ.get("JANITOR_INTERVAL_SEC", 600))
+
+
+def _retention(name: str, path: Path, max_age_hours: float) -> dict:
+    return {
+        "path": path,
+        "max_age_hours": float(os.environ.get(f"{name}_MAX_AGE_HOURS", max_age_hours)),
+        "max_bytes": int(os.environ.get(f"{name}_MAX_BYTES", 0)),
+        "max_entries": int(os.environ.get(f"{name}_MAX_ENTRIES", 0)),
+    }
+
+
+RETENTION_POLICIES = {
+    "uploads": _retention("UPLOADS", UPLOADS_DIR, 24),
+    "outputs": _retention("OUTPUTS", OUTPUTS_DIR, 0),
+    "pdf2image": _retention("PDF2IMAGE", PDF2IMAGE_DIR, 6),
+    "filters": _retention("FILTERS", FILTERS_DIR, 0),
+    "job_logs": _retention("JOB_LOGS", JOB_LOGS_DIR, 72),
+}
+if HANDOFF_DIR != PDF2IMAGE_DIR:
+    RETENTION_POLICIES["handoff"] = _retention("HANDOFF", HANDOFF_DIR, 6)
+
 # Default marker output directory (can be overridden by Marker flags or env)
 MARKER_OUTPUT_DIR = os.environ.get("MARKER_OUTPUT_DIR")
 if MARKER_OUTPUT_DIR:
@@ -43,5 +201,5 @@ else:
 
 # Ensure directories exist at runtime
 def ensure_dirs():
-    for p in (TEMP_DIR, UPLOADS_DIR, OUTPUTS_DIR, FILTERS_DIR, PDF2IMAGE_DIR, LOGS_DIR):
+    for p in (TEMP_DIR, UPLOADS_DIR, OUTPUTS_DIR, FILTERS_DIR, PDF2IMAGE_DIR, STATE_DIR, LOGS_DIR):
         p.mkdir(parents=True, exist_ok=True)
@@ -2,5 +2,9 @@ class MarkerError(Exception):
     """Raised when Marker processing fails."""
 
 
+class MarkerCancelled(MarkerError):
+    """Raised when a Marker run is cancelled (e.g. a hedged page finished elsewhere first)."""
+
+
 class InvalidFileError(Exception):
     """Raised for invalid uploads (non-PDF, too large, corrupt)."""
@@ -1,9 +1,123 @@
+import atexit
+import contextvars
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-from .config import LOG_FILE, ensure_dirs
+import queue
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from .config import LOG_FILE, LOG_FORMAT, LOG_CONSOLE_LEVEL, LOG_QUEUE_SIZE, LOG_SUBPROCESS_MAX_CHARS, JOB_LOGS_DIR, ensure_dirs
+from .metrics import metrics
 
 ensure_dirs()
 
+# Per-job context attached to every record emitted while it is set
+CONTEXT_FIELDS = ("job_id", "page", "stage")
+_log_context: contextvars.ContextVar[dict] = contextvars.ContextVar("log_context", default={})
+
+_listener = None
+_listener_lock = threading.Lock()
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+# Set once the first record is dropped because the queue was full
+_warned_queue_full = False
+
+
+class ContextFilter(logging.Filter):
+    """Copy the current job context onto the record in the emitting thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, ctx.get(field))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render message and traceback text in the emitting thread so the queued record
+        # no longer references caller objects (args, frames) by the time it is written
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("logging.dropped_records")
+            global _warned_queue_full
+            if not _warned_queue_full:
+                _warned_queue_full = True
+                # The queue is full, so report straight to stderr instead of through it
+                logging.lastResort.handle(logging.makeLogRecord({
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Log queue full (LOG_QUEUE_SIZE={LOG_QUEUE_SIZE}); dropping records,"
+                           f" see the logging.dropped_records metric",
+                }))
+
+
+def _start_listener():
+    """Start the single background thread that writes records to console and file."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        # Console handler
+        ch = logging.StreamHandler()
+        ch.setLevel(LOG_CONSOLE_LEVEL)
+        ch.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+        # File handler with rotation
+        # File handler should capture DEBUG-level details for troubleshooting Marker runs
+        fh = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+        fh.setLevel(logging.DEBUG)
+        if LOG_FORMAT == "json":
+            fh.setFormatter(JsonFormatter())
+        else:
+            fh.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s"))
+
+        _listener = QueueListener(_queue, ch, fh, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
 def get_logger(name: str = "marker_backend") -> logging.Logger:
     logger = logging.getLogger(name)
     if logger.handlers:
@@ -12,19 +126,47 @@ def get_logger(name: str = "marker_backend") -> logging.Logger:
     # Allow debug-level logging at the logger so handlers can filter separately
     logger.setLevel(logging.DEBUG)
 
-    # Console handler
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    ch_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    ch.setFormatter(ch_formatter)
-    logger.addHandler(ch)
-
-    # File handler with rotation
-    # File handler should capture DEBUG-level details for troubleshooting Marker runs
-    fh = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
-    fh_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
-    fh.setFormatter(fh_formatter)
-    logger.addHandler(fh)
+    # Records are only queued here; formatting and I/O happen on the listener thread
+    _start_listener()
+    qh = NonBlockingQueueHandler(_queue)
+    qh.addFilter(ContextFilter())
+    logger.addHandler(qh)
 
     return logger
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach job_id/page/stage (and other fields) to every record logged in the block."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def current_log_context() -> dict:
+    return dict(_log_context.get())
+
+
+def truncate_output(text: str, limit: int = LOG_SUBPROCESS_MAX_CHARS) -> str:
+    """Keep the head and tail of large subprocess output for the log."""
+    if not text or limit <= 0 or len(text) <= limit:
+        return text
+    half = limit // 2
+    return f"{text[:half]}\n... [{len(text) - limit} chars truncated] ...\n{text[-half:]}"
+
+
+def save_job_output(name: str, text: str):
+    """Store full subprocess output under JOB_LOGS_DIR/<job_id>/ when the job asked for it.
+
+    Returns the written path, or None if the current job did not request full output.
+    """
+    ctx = _log_context.get()
+    if not ctx.get("full_output") or not ctx.get("job_id"):
+        return None
+    job_dir = JOB_LOGS_DIR / str(ctx["job_id"])
+    job_dir.mkdir(parents=True, exist_ok=True)
+    path = job_dir / name
+    path.write_text(text or "", encoding="utf-8")
+    return path
@@ -0,0 +1,83 @@
+"""In-process metrics registry.
+
+Counters, gauges and timing observations kept in memory and exposed through
+`/api/metrics`. Timings keep a bounded window of recent values for percentiles.
+"""
+
+from collections import defaultdict, deque
+import threading
+
+# Number of recent observations kept per timing for percentile estimates
+WINDOW_SIZE = 1024
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._timings = {}
+
+    def inc(self, name: str, value: float = 1.0):
+        """Increase counter `name` by `value`."""
+        with self._lock:
+            self._counters[name] += value
+
+    def counter(self, name: str) -> float:
+        """Return the current value of counter `name` (0 if never increased)."""
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def set(self, name: str, value: float):
+        """Set gauge `name` to `value`."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Record one observation (e.g. a duration in seconds) for `name`."""
+        with self._lock:
+            stats = self._timings.get(name)
+            if stats is None:
+                stats = {"count": 0, "sum": 0.0, "max": 0.0, "window": deque(maxlen=WINDOW_SIZE)}
+                self._timings[name] = stats
+            stats["count"] += 1
+            stats["sum"] += value
+            stats["max"] = max(stats["max"], value)
+            stats["window"].append(value)
+
+    def percentile(self, name: str, q: float) -> float:
+        """Return the q-quantile (0..1) over the recent window of `name`."""
+        with self._lock:
+            stats = self._timings.get(name)
+            values = sorted(stats["window"]) if stats else []
+        return _percentile(values, q)
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serializable copy of all metrics."""
+        with self._lock:
+            timings = {}
+            for name, stats in self._timings.items():
+                values = sorted(stats["window"])
+                timings[name] = {
+                    "count": stats["count"],
+                    "sum": round(stats["sum"], 6),
+                    "max": round(stats["max"], 6),
+                    "p50": round(_percentile(values, 0.50), 6),
+                    "p95": round(_percentile(values, 0.95), 6),
+                    "p99": round(_percentile(values, 0.99), 6),
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+
+metrics = Metrics()
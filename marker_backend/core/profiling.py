@@ -0,0 +1,188 @@
+"""Opt-in per-job profiling.
+
+A job started with profiling enabled (`profile=true` on the request) collects:
+
+- a stage timeline as Chrome trace events (open `trace.json` in chrome://tracing or
+  https://ui.perfetto.dev): render, queue, preprocess, gpu_wait, marker, discovery,
+  combine, table parsing, one row per thread
+- a cProfile of the Python side in every thread that works on the job, merged into
+  `profile.pstats` (load with `pstats.Stats`) and summarized in `profile.txt`
+
+Results are written to JOB_LOGS_DIR/<job_id>/profile/ when the job ends.
+
+When the job has no profile, `span()` costs one ContextVar lookup and returns a
+shared no-op context manager.
+"""
+
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import List, Optional
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+from .config import JOB_LOGS_DIR
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Functions listed in profile.txt, by cumulative time
+PROFILE_TOP_FUNCTIONS = 60
+
+_active: contextvars.ContextVar[Optional["JobProfile"]] = contextvars.ContextVar("job_profile", default=None)
+_NOOP = nullcontext()
+# Threads currently running a cProfile (only one profiler may be active per thread)
+_thread_state = threading.local()
+
+
+def profile_dir(job_id: str) -> Path:
+    return JOB_LOGS_DIR / job_id / "profile"
+
+
+class JobProfile:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._events: List[dict] = []
+        self._threads = {}
+        self._profilers: List[cProfile.Profile] = []
+
+    def _ts(self, t: float) -> float:
+        """Microseconds since the profile started (Chrome trace time unit)."""
+        return round((t - self._origin) * 1e6, 1)
+
+    def add_span(self, name: str, start: float, end: float, args: dict):
+        tid = threading.get_ident()
+        event = {
+            "name": name,
+            "cat": "stage",
+            "ph": "X",
+            "ts": self._ts(start),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._threads.setdefault(tid, threading.current_thread().name)
+            self._events.append(event)
+
+    def add_profiler(self, profiler: cProfile.Profile):
+        with self._lock:
+            self._profilers.append(profiler)
+
+    def trace(self) -> dict:
+        with self._lock:
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            return {"traceEvents": names + list(self._events), "displayTimeUnit": "ms"}
+
+    def save(self) -> Path:
+        """Write trace.json, profile.pstats and profile.txt; returns the profile directory."""
+        out_dir = profile_dir(self.job_id)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        (out_dir / "trace.json").write_text(json.dumps(self.trace()), encoding="utf-8")
+
+        with self._lock:
+            profilers = list(self._profilers)
+        if profilers:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(str(out_dir / "profile.pstats"))
+            summary = io.StringIO()
+            pstats.Stats(str(out_dir / "profile.pstats"), stream=summary).sort_stats("cumulative").print_stats(
+                PROFILE_TOP_FUNCTIONS
+            )
+            (out_dir / "profile.txt").write_text(summary.getvalue(), encoding="utf-8")
+        return out_dir
+
+
+def current_profile() -> Optional[JobProfile]:
+    return _active.get()
+
+
+def span(name: str, **args):
+    """Context manager timing a stage of the current job; a no-op when it is not profiled."""
+    profile = _active.get()
+    if profile is None:
+        return _NOOP
+    return _span(profile, name, args)
+
+
+@contextmanager
+def _span(profile: JobProfile, name: str, args: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, start, time.perf_counter(), args)
+
+
+def record_span(name: str, start: float, end: float, **args):
+    """Record a stage measured elsewhere (perf_counter start/end), e.g. time spent queued."""
+    profile = _active.get()
+    if profile is not None:
+        profile.add_span(name, start, end, args)
+
+
+@contextmanager
+def thread_profiler():
+    """cProfile the current thread for the block if the current job is profiled.
+
+    Nested use in a thread that is already being profiled is a no-op.
+    """
+    profile = _active.get()
+    if profile is None or getattr(_thread_state, "active", False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another profiler is running in this thread (e.g. an external tool); keep the trace only
+        logger.debug(f"cProfile unavailable for job {profile.job_id}: {e}")
+        yield
+        return
+    _thread_state.active = True
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _thread_state.active = False
+        profile.add_profiler(profiler)
+
+
+@contextmanager
+def profile_job(job_id: str, enabled: bool, cprofile: bool = True):
+    """Profile everything done for the job inside the block when `enabled`.
+
+    With `cprofile=False` the calling thread only records the stage timeline. Async
+    handlers use that: a cProfile on the event loop thread across an `await` would
+    record every other request served meanwhile. They wrap their synchronous work
+    in `thread_profiler()` instead.
+    """
+    if not enabled:
+        yield None
+        return
+    profile = JobProfile(job_id)
+    token = _active.set(profile)
+    try:
+        with (thread_profiler() if cprofile else nullcontext()), span("job", job_id=job_id):
+            yield profile
+    finally:
+        _active.reset(token)
+        try:
+            out_dir = profile.save()
+            logger.info(f"Saved profile for job {job_id} to {out_dir}")
+        except Exception as e:
+            logger.warning(f"Failed to save profile for job {job_id}: {e}")
@@ -0,0 +1,370 @@
+"""Load generator for the Marker backend.
+
+    python -m marker_backend.loadtest --requests 200 --concurrency 16 --mix upload=1,download=3,health=6
+
+Starts the app in-process (uvicorn, on a free local port) with a stub Marker binary
+that sleeps for --marker-delay seconds and writes a small markdown file, so the HTTP
+layer, upload handling and threading can be exercised without a GPU or models.
+Temp files and logs go to a throwaway directory.
+
+Reported per endpoint: request count, error rate and latency percentiles; overall
+throughput; and the server event-loop lag, sampled by a probe task running on the
+server's loop. A handler that blocks the loop (e.g. a synchronous subprocess call in
+an `async def` route) shows up as large lag and as /health latency tracking upload time.
+With --max-lag-ms / --max-error-rate the exit status is 1 when a limit is exceeded,
+for use as a regression check.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+
+STUB_MARKER = '''#!{python}
+import pathlib, sys, time
+args = sys.argv[1:]
+src = pathlib.Path(args[0])
+out = pathlib.Path(args[args.index("--output_dir") + 1])
+time.sleep({delay})
+page_dir = out / src.stem
+page_dir.mkdir(parents=True, exist_ok=True)
+(page_dir / (src.stem + ".md")).write_text(
+    "# Stub output for " + src.stem + "\\n\\n| a | b |\\n|---|---|\\n| 1 | 2 |\\n", encoding="utf-8"
+)
+'''
+
+# Probe interval for event-loop lag sampling
+LAG_INTERVAL_SEC = 0.01
+
+
+def _make_png(width: int, height: int) -> bytes:
+    """Return a white grayscale PNG with a few dark lines (stdlib only)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    rows = bytearray()
+    for y in range(height):
+        value = 0 if y % 40 in (20, 21) else 255
+        rows += b"\x00" + bytes([value]) * width
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(bytes(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _multipart(field: str, filename: str, data: bytes, content_type: str) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("upload", "download", "health"):
+            raise argparse.ArgumentTypeError(f"Unknown request kind in mix: {name}")
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Mix needs at least one positive weight")
+    return mix
+
+
+def _prepare_environment(work_dir: Path, marker_delay: float) -> Path:
+    """Point the app at a throwaway temp tree and a stub Marker binary. Must run before importing the app."""
+    stub = work_dir / "stub_marker.py"
+    stub.write_text(STUB_MARKER.format(python=sys.executable, delay=marker_delay), encoding="utf-8")
+    stub.chmod(stub.stat().st_mode | stat.S_IXUSR)
+    os.environ.update({
+        "TEMP_DIR": str(work_dir / "temp"),
+        "LOGS_DIR": str(work_dir / "logs"),
+        "MARKER_CLI": str(stub),
+        "LOG_CONSOLE_LEVEL": os.environ.get("LOG_CONSOLE_LEVEL", "WARNING"),
+        "JANITOR_ENABLED": "0",
+        "JOB_RESUME_ON_STARTUP": "0",
+        # Keep the GPU wait out of the measurement
+        "GPU_WAIT_TIMEOUT_SEC": os.environ.get("GPU_WAIT_TIMEOUT_SEC", "1"),
+    })
+    return stub
+
+
+class LagMonitor:
+    """Measures how late a periodic sleep on the server's event loop wakes up."""
+
+    def __init__(self, interval: float = LAG_INTERVAL_SEC):
+        self.interval = interval
+        self.samples: List[float] = []
+        self.running = True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+
+class InProcessServer:
+    """Runs the FastAPI app with uvicorn on its own thread and event loop."""
+
+    def __init__(self, port: int):
+        import uvicorn
+        from .main import app
+
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.lag = LagMonitor()
+        self._thread = threading.Thread(target=self._run, name="loadtest-server", daemon=True)
+
+    def _run(self):
+        async def serve():
+            lag_task = asyncio.create_task(self.lag.run())
+            try:
+                await self.server.serve()
+            finally:
+                self.lag.running = False
+                await lag_task
+
+        asyncio.run(serve())
+
+    def start(self, timeout: float = 30):
+        self._thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=30)
+
+
+class LoadClient:
+    def __init__(self, base_url: str, upload_bytes: bytes, upload_suffix: str, timeout: float):
+        self.base_url = base_url
+        self.upload_bytes = upload_bytes
+        self.upload_suffix = upload_suffix
+        self.timeout = timeout
+        self.documents: List[str] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _request(self, req: urllib.request.Request) -> Tuple[int, bytes]:
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def upload(self) -> int:
+        name = f"load_{next(self._counter):06d}{self.upload_suffix}"
+        content_type = "application/pdf" if self.upload_suffix == ".pdf" else "image/png"
+        body, header = _multipart("file", name, self.upload_bytes, content_type)
+        req = urllib.request.Request(
+            f"{self.base_url}/api/upload", data=body, method="POST", headers={"Content-Type": header}
+        )
+        status, payload = self._request(req)
+        if status == 200:
+            with self._lock:
+                self.documents.append(json.loads(payload)["merged_path"])
+        return status
+
+    def download(self) -> int:
+        with self._lock:
+            document = random.choice(self.documents) if self.documents else None
+        if document is None:
+            return self.upload()
+        url = f"{self.base_url}/api/download/{urllib.request.quote(document)}"
+        return self._request(urllib.request.Request(url))[0]
+
+    def health(self) -> int:
+        return self._request(urllib.request.Request(f"{self.base_url}/health"))[0]
+
+
+def run_load(
+    client: LoadClient,
+    mix: Dict[str, int],
+    total_requests: int,
+    concurrency: int,
+    duration: Optional[float],
+) -> Tuple[Dict[str, List[Tuple[float, bool]]], float]:
+    """Fire requests from `concurrency` threads. Returns ({kind: [(seconds, ok)]}, wall_seconds)."""
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    results: Dict[str, List[Tuple[float, bool]]] = {kind: [] for kind in mix}
+    lock = threading.Lock()
+    issued = itertools.count()
+    deadline = time.time() + duration if duration else None
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        while True:
+            if deadline is not None:
+                if time.time() >= deadline:
+                    return
+            elif next(issued) >= total_requests:
+                return
+            kind = rng.choice(kinds)
+            start = time.perf_counter()
+            try:
+                ok = getattr(client, kind)() == 200
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                results[kind].append((elapsed, ok))
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, seed) for seed in range(concurrency)]:
+            future.result()
+    return results, time.time() - start
+
+
+def build_report(results: Dict[str, List[Tuple[float, bool]]], wall: float, lag_samples: List[float]) -> dict:
+    report = {"wall_seconds": round(wall, 3), "endpoints": {}}
+    total = errors = 0
+    for kind, samples in results.items():
+        latencies = sorted(seconds for seconds, _ in samples)
+        failed = sum(1 for _, ok in samples if not ok)
+        total += len(samples)
+        errors += failed
+        report["endpoints"][kind] = {
+            "requests": len(samples),
+            "errors": failed,
+            "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+            "throughput_rps": round(len(samples) / wall, 2) if wall else 0.0,
+            **{
+                f"p{int(q * 100)}_ms": round(_percentile(latencies, q) * 1000, 2)
+                for q in (0.5, 0.95, 0.99)
+            },
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+    lag = sorted(lag_samples)
+    report["total"] = {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / wall, 2) if wall else 0.0,
+    }
+    report["event_loop_lag"] = {
+        "samples": len(lag),
+        "p50_ms": round(_percentile(lag, 0.5) * 1000, 2),
+        "p99_ms": round(_percentile(lag, 0.99) * 1000, 2),
+        "max_ms": round(lag[-1] * 1000, 2) if lag else 0.0,
+    }
+    return report
+
+
+def print_report(report: dict):
+    print(f"\nWall time: {report['wall_seconds']}s")
+    header = f"{'endpoint':<10}{'reqs':>7}{'errors':>8}{'err%':>7}{'rps':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'maxms':>9}"
+    print(header)
+    print("-" * len(header))
+    for kind, s in report["endpoints"].items():
+        print(
+            f"{kind:<10}{s['requests']:>7}{s['errors']:>8}{s['error_rate'] * 100:>7.1f}{s['throughput_rps']:>8.2f}"
+            f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}"
+        )
+    t = report["total"]
+    print(f"{'total':<10}{t['requests']:>7}{t['errors']:>8}{t['error_rate'] * 100:>7.1f}{t['throughput_rps']:>8.2f}")
+    lag = report["event_loop_lag"]
+    print(f"\nEvent-loop lag: p50 {lag['p50_ms']}ms  p99 {lag['p99_ms']}ms  max {lag['max_ms']}ms ({lag['samples']} samples)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m marker_backend.loadtest", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100, help="Total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("upload=1,download=3,health=6"),
+                        help="Request weights, e.g. upload=1,download=3,health=6")
+    parser.add_argument("--marker-delay", type=float, default=0.5, help="Seconds the stub Marker takes per call")
+    parser.add_argument("--upload-file", type=Path, default=None, help="File to upload (default: generated PNG)")
+    parser.add_argument("--image-size", default="1200x1600", help="Size of the generated PNG, WIDTHxHEIGHT")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--max-lag-ms", type=float, default=None, help="Fail if event-loop lag p99 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="Fail if the error rate exceeds this (0-1)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary work directory")
+    args = parser.parse_args(argv)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="marker_loadtest_"))
+    _prepare_environment(work_dir, args.marker_delay)
+
+    if args.upload_file:
+        upload_bytes, suffix = args.upload_file.read_bytes(), args.upload_file.suffix.lower()
+    else:
+        width, height = (int(v) for v in args.image_size.lower().split("x"))
+        upload_bytes, suffix = _make_png(width, height), ".png"
+
+    server = InProcessServer(_free_port())
+    server.start()
+    try:
+        client = LoadClient(f"http://127.0.0.1:{server.port}", upload_bytes, suffix, args.timeout)
+        if args.mix.get("download"):
+            client.upload()  # so downloads have a document from the start
+        results, wall = run_load(client, args.mix, args.requests, max(1, args.concurrency), args.duration)
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = build_report(results, wall, server.lag.samples)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+        if args.keep:
+            print(f"Work directory kept at {work_dir}")
+
+    failed = False
+    if args.max_lag_ms is not None and report["event_loop_lag"]["p99_ms"] > args.max_lag_ms:
+        print(f"FAIL: event-loop lag p99 {report['event_loop_lag']['p99_ms']}ms > {args.max_lag_ms}ms", file=sys.stderr)
+        failed = True
+    if args.max_error_rate is not None and report["total"]["error_rate"] > args.max_error_rate:
+        print(f"FAIL: error rate {report['total']['error_rate']} > {args.max_error_rate}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,11 @@
 from fastapi import FastAPI
 import uvicorn
 from .api.endpoints import router as api_router
-from .core.config import ensure_dirs, HOST, PORT
+from .api.debug import router as debug_router
+from .core.config import ensure_dirs, HOST, PORT, JANITOR_ENABLED, JOB_RESUME_ON_STARTUP
 from .core.logger import get_logger
+from .services.janitor import janitor
+from .services.job_recovery import resume_unfinished_jobs
 from fastapi.middleware.cors import CORSMiddleware
 
 ensure_dirs()
@@ -20,6 +23,21 @@ app.add_middleware(
 )
 
 app.include_router(api_router, prefix="/api")
+app.include_router(debug_router, prefix="/debug")
+
+
+@app.on_event("startup")
+def start_background_tasks():
+    # Claim interrupted jobs' files before the janitor's first pass
+    if JOB_RESUME_ON_STARTUP:
+        resume_unfinished_jobs()
+    if JANITOR_ENABLED:
+        janitor.start()
+
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    janitor.stop()
 
 
 @app.get("/health")
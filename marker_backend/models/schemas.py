@@ -7,6 +7,7 @@ class UploadResponse(BaseModel):
     filename: str
     merged_path: str
     processing_time_seconds: Optional[float]
+    job_id: Optional[str] = None
 
 
 class TableExtractionResponse(BaseModel):
@@ -16,3 +17,29 @@ class TableExtractionResponse(BaseModel):
     tables_count: int
     excel_folder: str
     excel_files: List[str]
+    job_id: Optional[str] = None
+
+
+class SearchHit(BaseModel):
+    document: str
+    page: int
+    snippet: str
+    score: float
+
+
+class TableCellHit(BaseModel):
+    document: str
+    page: int
+    table: int
+    row: int
+    column: int
+    header: str
+    value: str
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: List[SearchHit]
+    table_hits: List[TableCellHit]
+    query_time_ms: float
@@ -0,0 +1,66 @@
+"""Registry of paths that belong to jobs currently in flight.
+
+Anything that deletes from the temp tree (the janitor) must check `is_active`
+first so a running job never loses its upload, page images or outputs.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+import threading
+
+
+class ActiveJobs:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Resolved path -> number of jobs holding it (the same path may be held twice)
+        self._paths: Dict[Path, int] = {}
+
+    @staticmethod
+    def _key(path: Path) -> Path:
+        try:
+            return Path(path).resolve()
+        except Exception:
+            return Path(path).absolute()
+
+    def acquire(self, *paths: Path):
+        with self._lock:
+            for p in paths:
+                key = self._key(p)
+                self._paths[key] = self._paths.get(key, 0) + 1
+
+    def release(self, *paths: Path):
+        with self._lock:
+            for p in paths:
+                key = self._key(p)
+                count = self._paths.get(key, 0) - 1
+                if count > 0:
+                    self._paths[key] = count
+                else:
+                    self._paths.pop(key, None)
+
+    @contextmanager
+    def track(self, *paths: Path):
+        """Mark `paths` as in use for the duration of the block."""
+        self.acquire(*paths)
+        try:
+            yield
+        finally:
+            self.release(*paths)
+
+    def is_active(self, path: Path) -> bool:
+        """Return True if `path` is, contains, or lies inside a path held by a running job."""
+        key = self._key(path)
+        with self._lock:
+            held = list(self._paths)
+        for active in held:
+            if key == active or key in active.parents or active in key.parents:
+                return True
+        return False
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._paths)
+
+
+active_jobs = ActiveJobs()
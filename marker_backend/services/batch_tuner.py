@@ -0,0 +1,305 @@
+"""Adaptive batch sizing for Marker runs.
+
+Marker's batch sizes (``recognition_batch_size``, ``detection_batch_size``,
+``table_rec_batch_size``...) come from ``marker_config.json`` and are fixed regardless
+of the GPU they run on. This module scales them to the memory that is actually free,
+halves them when Marker dies with a CUDA out-of-memory error and grows them back after
+a streak of successful runs. What is learned is a factor on the free-memory scale, so
+an OOM while the card was busy does not cap runs once memory is free again. It is
+persisted per GPU model so restarts (and other hosts with the same card) start from
+the known-good value.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from ..core.config import (
+    MARKER_CONFIG_JSON,
+    STATE_DIR,
+    ADAPTIVE_BATCH_SIZING,
+    BATCH_REFERENCE_FREE_MB,
+    BATCH_GROW_AFTER_SUCCESSES,
+    BATCH_GROW_FACTOR,
+    BATCH_CEILING_RESET_SUCCESSES,
+    BATCH_MIN_SCALE,
+    BATCH_TUNING_FILE,
+)
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Substrings in Marker/torch stderr that identify an allocation failure on the device
+OOM_MARKERS = (
+    "CUDA out of memory",
+    "OutOfMemoryError",
+    "CUDA error: out of memory",
+    "CUBLAS_STATUS_ALLOC_FAILED",
+)
+
+# Never scale above the configured batch sizes by more than this factor
+MAX_SCALE = 2.0
+# Growth smaller than this fraction is not applied (nor saved and logged)
+MIN_GROWTH = 0.01
+# Per-run Marker configs left behind by killed processes are removed after this long
+MARKER_CONFIG_MAX_AGE_SEC = 3600
+
+
+@dataclass
+class BatchPlan:
+    """Batch settings chosen for a single Marker run."""
+
+    device: Optional[str]
+    scale: float
+    config: Optional[dict]
+    # Unscaled settings the plan was derived from, used to re-scale on OOM
+    base_config: Optional[dict] = None
+    # Scale the free memory allowed when the plan was made; `scale` is at most this
+    memory_scale: float = 1.0
+
+
+def is_oom_error(stderr: str) -> bool:
+    """Return True if Marker's stderr reports a device out-of-memory failure."""
+    if not stderr:
+        return False
+    return any(marker in stderr for marker in OOM_MARKERS)
+
+
+def load_base_config(path: Path = MARKER_CONFIG_JSON) -> dict:
+    """Load the base Marker config. Returns an empty dict if the file is missing or invalid."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.debug(f"Marker config not found at {path}; using Marker defaults")
+    except Exception as e:
+        logger.warning(f"Could not read Marker config {path}: {e}")
+    return {}
+
+
+def scale_batch_sizes(config: dict, scale: float) -> dict:
+    """Return a copy of `config` with every ``*_batch_size`` value multiplied by `scale`."""
+    scaled = dict(config)
+    for key, value in config.items():
+        if key.endswith("_batch_size") and isinstance(value, (int, float)):
+            scaled[key] = max(1, int(round(value * scale)))
+    return scaled
+
+
+@contextmanager
+def marker_config_file(config: Optional[dict]) -> Iterator[Optional[Path]]:
+    """Write `config` to a file of its own in STATE_DIR for one Marker run and remove it afterwards.
+
+    Yields None (and writes nothing) when there is no config.
+    """
+    if not config:
+        yield None
+        return
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix="marker_config_", suffix=".json", dir=STATE_DIR)
+    path = Path(name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(config, f, sort_keys=True, indent=2)
+        yield path
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def prune_marker_configs(max_age: float = MARKER_CONFIG_MAX_AGE_SEC):
+    """Remove Marker configs in STATE_DIR that outlived their run (e.g. the process was killed)."""
+    cutoff = time.time() - max_age
+    for path in STATE_DIR.glob("marker_config_*.json"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            continue
+
+
+def _query_devices() -> List[Tuple[int, str, int]]:
+    """Return list of tuples (index, name, mem_free_mb) for each GPU, or [] without nvidia-smi."""
+    try:
+        res = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index,name,memory.free", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True,
+        )
+        if res.returncode != 0:
+            return []
+        out = []
+        for ln in res.stdout.splitlines():
+            parts = [p.strip() for p in ln.split(",")]
+            if len(parts) >= 3:
+                out.append((int(parts[0]), parts[1], int(parts[2])))
+        return out
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logger.debug(f"Error querying nvidia-smi for batch sizing: {e}")
+        return []
+
+
+def _current_device() -> Optional[Tuple[str, int]]:
+    """Return (model name, free MB) of the GPU Marker will run on, honouring CUDA_VISIBLE_DEVICES."""
+    devices = _query_devices()
+    if not devices:
+        return None
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",")[0].strip()
+    if visible.isdigit():
+        for idx, name, free_mb in devices:
+            if idx == int(visible):
+                return name, free_mb
+    _, name, free_mb = devices[0]
+    return name, free_mb
+
+
+class BatchTuner:
+    """Thread-safe controller holding the learned batch scale for each GPU model.
+
+    State per device model, as factors on the scale the free memory allows:
+    - factor: share of the free-memory scale to use (at most 1.0)
+    - ceiling: smallest factor that has hit OOM (growth stays below it)
+    - successes: consecutive successful runs since the last change
+    - clean_runs: successful runs since the last OOM; the ceiling is dropped after
+      BATCH_CEILING_RESET_SUCCESSES of them, so one bad moment does not cap growth forever
+    """
+
+    def __init__(self, state_file: Path = BATCH_TUNING_FILE):
+        self._state_file = state_file
+        self._lock = threading.Lock()
+        self._state: Dict[str, dict] = self._load()
+        prune_marker_configs()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with self._state_file.open("r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable batch tuning state {self._state_file}: {e}")
+            return {}
+        # Earlier versions stored absolute scales, which mixed in the free memory of the moment
+        stale = [device for device, entry in state.items() if "factor" not in entry]
+        for device in stale:
+            logger.info(f"Resetting batch tuning for {device}: state predates free-memory relative factors")
+            del state[device]
+        return state
+
+    def _save(self):
+        try:
+            self._state_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._state_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._state, indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, self._state_file)
+        except Exception as e:
+            logger.warning(f"Could not persist batch tuning state: {e}")
+
+    def _entry(self, device: str) -> dict:
+        return self._state.setdefault(
+            device, {"factor": 1.0, "ceiling": None, "successes": 0, "clean_runs": 0}
+        )
+
+    def plan(self, overrides: Optional[dict] = None, user_config: Optional[Path] = None) -> BatchPlan:
+        """Choose batch settings for the next Marker run.
+
+        The config is MARKER_CONFIG_JSON, then `user_config` (a --config_json given in
+        MARKER_FLAGS), then `overrides`, each overriding the previous. Without a GPU (or
+        with adaptive sizing disabled) it is passed on unscaled.
+        """
+        config = load_base_config()
+        if user_config is not None:
+            if not user_config.is_file():
+                logger.warning(f"--config_json {user_config} from MARKER_FLAGS not found; ignoring it")
+            config.update(load_base_config(user_config))
+        config.update(overrides or {})
+        device = _current_device() if ADAPTIVE_BATCH_SIZING else None
+        if device is None:
+            return BatchPlan(device=None, scale=1.0, config=config or None)
+
+        name, free_mb = device
+        with self._lock:
+            factor = self._entry(name)["factor"]
+        memory_scale = min(MAX_SCALE, free_mb / max(1, BATCH_REFERENCE_FREE_MB))
+        scale = max(BATCH_MIN_SCALE, factor * memory_scale)
+
+        logger.debug(
+            f"Batch plan for {name}: free={free_mb}MB memory_scale={memory_scale:.3f}"
+            f" factor={factor:.3f} scale={scale:.3f}"
+        )
+        return BatchPlan(
+            device=name,
+            scale=scale,
+            config=scale_batch_sizes(config, scale),
+            base_config=config,
+            memory_scale=memory_scale,
+        )
+
+    def record_success(self, plan: BatchPlan):
+        """Count a successful run and grow the learned factor after enough of them."""
+        if plan.device is None:
+            return
+        with self._lock:
+            entry = self._entry(plan.device)
+            entry["clean_runs"] += 1
+            if entry["ceiling"] is not None and entry["clean_runs"] >= BATCH_CEILING_RESET_SUCCESSES:
+                logger.info(
+                    f"No OOM on {plan.device} in {entry['clean_runs']} runs;"
+                    f" dropping batch factor ceiling {entry['ceiling']:.3f}"
+                )
+                entry["ceiling"] = None
+                self._save()
+            if entry["factor"] >= 1.0:
+                return
+            entry["successes"] += 1
+            if entry["successes"] < BATCH_GROW_AFTER_SUCCESSES:
+                return
+            entry["successes"] = 0
+            target = min(1.0, entry["factor"] * BATCH_GROW_FACTOR)
+            if entry["ceiling"] is not None:
+                # Approach the factor that failed but never reach it again
+                target = min(target, (entry["factor"] + entry["ceiling"]) / 2)
+            if target > entry["factor"] * (1 + MIN_GROWTH):
+                logger.info(f"Growing Marker batch factor for {plan.device}: {entry['factor']:.3f} -> {target:.3f}")
+                entry["factor"] = target
+                self._save()
+
+    def record_oom(self, plan: BatchPlan) -> Optional[BatchPlan]:
+        """Halve the batch scale after an OOM. Returns the plan to retry with, or None at the floor."""
+        if plan.device is None:
+            return None
+        new_scale = plan.scale / 2
+        # Remember the failure relative to the memory that was free, not as an absolute scale
+        failed_factor = plan.scale / max(plan.memory_scale, BATCH_MIN_SCALE)
+        with self._lock:
+            entry = self._entry(plan.device)
+            entry["successes"] = 0
+            entry["clean_runs"] = 0
+            if entry["ceiling"] is None or failed_factor < entry["ceiling"]:
+                entry["ceiling"] = failed_factor
+            entry["factor"] = min(entry["factor"], failed_factor / 2)
+            self._save()
+        if new_scale < BATCH_MIN_SCALE:
+            logger.error(f"Marker OOM on {plan.device} at minimum batch scale {plan.scale:.3f}")
+            return None
+        logger.warning(f"Marker OOM on {plan.device}; retrying with batch scale {plan.scale:.3f} -> {new_scale:.3f}")
+        # Re-derive from the unscaled config so rounding does not accumulate
+        base = plan.base_config or {}
+        return BatchPlan(
+            device=plan.device,
+            scale=new_scale,
+            config=scale_batch_sizes(base, new_scale),
+            base_config=base,
+            memory_scale=plan.memory_scale,
+        )
+
+
+batch_tuner = BatchTuner()
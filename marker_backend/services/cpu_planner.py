@@ -0,0 +1,313 @@
+"""CPU execution planner for hosts without a GPU.
+
+Each marker_single process sizes its torch/OpenMP thread pool to every core it can
+see, so running several at once oversubscribes the CPU. The planner hands out
+`workers` slots; every Marker run takes one, which bounds how many run at once
+across all jobs. The cores are split among the runs that actually run together
+(`concurrent`: the worker count, but no more than PAGE_WORKERS pages of a document),
+so a single run still gets every core. Each run starts with its share in
+OMP_NUM_THREADS / MKL_NUM_THREADS (torch's intra-op pool follows OMP_NUM_THREADS)
+and, with CPU_AFFINITY=1, pinned to its cores.
+
+The worker count comes from CPU_WORKERS, else from a calibration run, else from
+CPU_DEFAULT_THREADS cores per worker (but at least PAGE_WORKERS). PAGE_WORKERS stays
+the ceiling for pages run in parallel per document; the plan can only lower it, so
+raise PAGE_WORKERS to the calibrated worker count to get the calibrated throughput.
+Calibrate once per machine type with a representative page image:
+
+    python -m marker_backend.services.cpu_planner calibrate sample_page.png
+
+The calibration result is kept in CPU_CALIBRATION_FILE and used automatically.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+from ..core.config import (
+    CPU_AFFINITY,
+    CPU_CALIBRATION_FILE,
+    CPU_DEFAULT_THREADS,
+    CPU_PLANNER,
+    CPU_WORKERS,
+    PAGE_WORKERS,
+)
+from ..core.logger import get_logger
+from ..core.metrics import metrics
+from .gpu_manager import has_gpu
+
+logger = get_logger(__name__)
+
+# Environment variables that size the thread pools of torch and the BLAS libraries
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+# Worker counts tried by calibration (capped at the number of cores)
+CALIBRATION_WORKERS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+# Calibration stops once throughput falls below this fraction of the best seen
+CALIBRATION_STOP_RATIO = 0.8
+
+
+def available_cpus() -> List[int]:
+    """Return the CPU ids this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+@dataclass
+class CpuPlan:
+    workers: int
+    # Marker runs expected at the same time; the cores are divided among them
+    concurrent: int
+    threads: int
+    source: str
+    cpus: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class CpuSlot:
+    index: int
+    threads: int
+    cpus: Optional[List[int]]
+
+    def env(self, base: Dict[str, str]) -> Dict[str, str]:
+        """Return `base` with the thread pool sizes of this slot."""
+        env = dict(base)
+        for name in THREAD_ENV_VARS:
+            env[name] = str(self.threads)
+        return env
+
+
+def _load_calibration(path: Path, cpu_count: int) -> Optional[dict]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable CPU calibration {path}: {e}")
+        return None
+    if data.get("cpus") != cpu_count:
+        logger.info(f"CPU calibration was made for {data.get('cpus')} cores, this host has {cpu_count}; ignoring it")
+        return None
+    return data
+
+
+def _gpu_present() -> bool:
+    if os.environ.get("TORCH_DEVICE", "").lower() == "cpu":
+        return False
+    return has_gpu()
+
+
+class CpuPlanner:
+    """Hands out CPU slots to Marker runs according to the current `CpuPlan`."""
+
+    def __init__(self, mode: str = CPU_PLANNER, calibration_file: Path = CPU_CALIBRATION_FILE):
+        self.mode = mode
+        self.calibration_file = calibration_file
+        self._lock = threading.Lock()
+        self._plan: Optional[CpuPlan] = None
+        self._slots: "queue.PriorityQueue[int]" = queue.PriorityQueue()
+        self._active: Optional[bool] = None
+        self._warned: Set[Tuple[int, int]] = set()
+
+    @property
+    def active(self) -> bool:
+        if self._active is None:
+            self._active = self.mode in ("1", "on") or (self.mode == "auto" and not _gpu_present())
+        return self._active
+
+    def _build_plan(self, workers: Optional[int] = None) -> CpuPlan:
+        cpus = available_cpus()
+        source = "override"
+        if workers is None:
+            if CPU_WORKERS > 0:
+                workers, source = CPU_WORKERS, "env"
+            else:
+                calibration = _load_calibration(self.calibration_file, len(cpus))
+                if calibration:
+                    workers, source = int(calibration["workers"]), "calibration"
+                else:
+                    # Without an explicit choice never run fewer Marker processes than PAGE_WORKERS
+                    workers = max(PAGE_WORKERS, len(cpus) // max(1, CPU_DEFAULT_THREADS))
+                    source = "default"
+        workers = max(1, workers)
+        # Calibration runs `workers` at once; documents run at most PAGE_WORKERS pages at once
+        concurrent = workers if source == "override" else max(1, min(workers, PAGE_WORKERS))
+        if concurrent < workers:
+            logger.info(
+                f"CPU plan has {workers} workers but PAGE_WORKERS={PAGE_WORKERS};"
+                f" raise PAGE_WORKERS to run more pages at once"
+            )
+        return CpuPlan(
+            workers=workers,
+            concurrent=concurrent,
+            threads=max(1, len(cpus) // concurrent),
+            source=source,
+            cpus=cpus,
+        )
+
+    def configure(self, workers: Optional[int] = None) -> CpuPlan:
+        """(Re)build the plan, optionally forcing the worker count. Waits for running slots to be returned."""
+        plan = self._build_plan(workers)
+        with self._lock:
+            old = self._plan
+            if old is not None:
+                for _ in range(old.workers):
+                    self._slots.get()
+            self._plan = plan
+            # Lowest free index first, so runs that overlap in time get distinct cores
+            self._slots = queue.PriorityQueue()
+            for index in range(plan.workers):
+                self._slots.put(index)
+        metrics.set("cpu.workers", plan.workers)
+        metrics.set("cpu.threads_per_worker", plan.threads)
+        logger.info(
+            f"CPU plan ({plan.source}): {plan.workers} workers, {plan.concurrent} concurrent x {plan.threads} threads"
+            f" on {len(plan.cpus)} cores{' with affinity' if CPU_AFFINITY else ''}"
+        )
+        return plan
+
+    def plan(self) -> CpuPlan:
+        if self._plan is None:
+            with self._lock:
+                if self._plan is not None:
+                    return self._plan
+            self.configure()
+        return self._plan
+
+    def page_workers(self, configured: int) -> int:
+        """Pages to run in parallel per document.
+
+        `configured` (PAGE_WORKERS) is a ceiling: an active plan only lowers it to its
+        number of slots, since more pages than slots would just wait for a slot.
+        """
+        if not self.active:
+            return configured
+        plan = self.plan()
+        if plan.workers >= configured:
+            return configured
+        if (configured, plan.workers) not in self._warned:
+            self._warned.add((configured, plan.workers))
+            logger.warning(
+                f"PAGE_WORKERS={configured} lowered to {plan.workers} by the CPU plan ({plan.source});"
+                f" set CPU_WORKERS or CPU_PLANNER=0 to change this"
+            )
+        return plan.workers
+
+    @contextmanager
+    def slot(self):
+        """Hold a CPU slot for one Marker run; yields None when the planner is inactive."""
+        if not self.active:
+            yield None
+            return
+        plan = self.plan()
+        slots = self._slots
+        start = time.perf_counter()
+        index = slots.get()
+        metrics.observe("cpu.slot_wait_seconds", time.perf_counter() - start)
+        cpus = None
+        if CPU_AFFINITY:
+            # Slots beyond `concurrent` (or more workers than cores) share cores round-robin
+            cpus = [plan.cpus[(index * plan.threads + i) % len(plan.cpus)] for i in range(plan.threads)]
+        try:
+            yield CpuSlot(index=index, threads=plan.threads, cpus=cpus)
+        finally:
+            slots.put(index)
+
+
+def set_affinity(pid: int, cpus: Optional[List[int]]):
+    """Pin process `pid` to `cpus` where the platform supports it."""
+    if not cpus:
+        return
+    try:
+        os.sched_setaffinity(pid, cpus)
+    except (AttributeError, OSError) as e:
+        logger.debug(f"Could not set CPU affinity for pid {pid}: {e}")
+
+
+def calibrate(sample: Path, max_workers: Optional[int] = None, runs_per_worker: int = 2) -> dict:
+    """Measure pages/sec for increasing worker counts on `sample` and save the best plan.
+
+    Runs Marker `workers * runs_per_worker` times per candidate, `workers` at a time.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .marker_runner import run_marker_for_chunk
+
+    cpus = available_cpus()
+    limit = min(max_workers or len(cpus), len(cpus))
+    candidates = [w for w in CALIBRATION_WORKERS if w <= limit]
+    results: Dict[int, float] = {}
+    best = 0.0
+    work_dir = Path(tempfile.mkdtemp(prefix="cpu_calibration_"))
+    try:
+        for workers in candidates:
+            plan = cpu_planner.configure(workers)
+            runs = workers * runs_per_worker
+            inputs = []
+            for i in range(runs):
+                dst = work_dir / f"w{workers}" / "in" / f"calib_{i:03d}{sample.suffix}"
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(sample, dst)
+                inputs.append(dst)
+            out_dir = work_dir / f"w{workers}" / "out"
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda p: run_marker_for_chunk(p, output_dir=out_dir), inputs))
+            pages_per_sec = runs / (time.time() - start)
+            results[workers] = round(pages_per_sec, 4)
+            logger.info(f"Calibration: {workers} workers x {plan.threads} threads -> {pages_per_sec:.3f} pages/s")
+            best = max(best, pages_per_sec)
+            if pages_per_sec < best * CALIBRATION_STOP_RATIO:
+                break
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    chosen = max(results, key=results.get)
+    calibration = {
+        "cpus": len(cpus),
+        "workers": chosen,
+        "threads_per_worker": max(1, len(cpus) // chosen),
+        "pages_per_sec": results,
+        "sample": str(sample),
+        "calibrated_at": time.time(),
+    }
+    cpu_planner.calibration_file.parent.mkdir(parents=True, exist_ok=True)
+    cpu_planner.calibration_file.write_text(json.dumps(calibration, indent=2), encoding="utf-8")
+    cpu_planner.configure()
+    return calibration
+
+
+cpu_planner = CpuPlanner()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m marker_backend.services.cpu_planner")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="Find the worker count with the best pages/sec")
+    cal.add_argument("sample", type=Path, help="Representative page image")
+    cal.add_argument("--max-workers", type=int, default=None)
+    cal.add_argument("--runs-per-worker", type=int, default=2)
+    sub.add_parser("show", help="Print the current plan")
+    args = parser.parse_args(argv)
+
+    if args.command == "calibrate":
+        print(json.dumps(calibrate(args.sample, args.max_workers, args.runs_per_worker), indent=2))
+    else:
+        print(json.dumps({"active": cpu_planner.active, **cpu_planner.plan().to_dict()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+"""Split multi-frame and very tall images into page images.
+
+A multi-page fax TIFF or a long screenshot sent to Marker as a single input is
+processed serially (or not at all). This module turns such uploads into the same
+`<stem>_page_NNNN.png` page images that PDF rendering produces, so they go through
+the per-page pipeline in `pdf_converter`:
+
+- every frame of a multi-frame image (TIFF, animated formats) becomes a page
+- images taller than TILE_MAX_ASPECT x their width are cut into tiles about
+  TILE_HEIGHT_RATIO x width tall, with cuts moved to the emptiest nearby row so
+  text lines are not sliced in half
+"""
+
+from pathlib import Path
+from typing import List
+
+from ..core.config import TILE_MAX_ASPECT, TILE_HEIGHT_RATIO, TILE_MIN_HEIGHT
+from ..core.exceptions import MarkerError
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Cuts may move this fraction of a tile's height away from the nominal boundary
+CUT_SEARCH_FRACTION = 0.1
+
+
+def _is_tall(width: int, height: int) -> bool:
+    return height >= TILE_MIN_HEIGHT and height > TILE_MAX_ASPECT * width
+
+
+def needs_splitting(image_path: Path) -> bool:
+    """Return True if the image has several frames or is tall enough to be tiled."""
+    try:
+        from PIL import Image
+
+        with Image.open(image_path) as img:
+            return getattr(img, "n_frames", 1) > 1 or _is_tall(img.width, img.height)
+    except Exception as e:
+        logger.debug(f"Could not inspect {image_path} for splitting: {e}")
+        return False
+
+
+def _cut_rows(gray, tile_height: int) -> List[int]:
+    """Return row indices at which to cut a tall grayscale array into tiles."""
+    import numpy as np
+
+    height = gray.shape[0]
+    # Darkness per row; cuts prefer rows with the least ink
+    darkness = 255.0 - gray.mean(axis=1)
+    window = max(1, int(tile_height * CUT_SEARCH_FRACTION))
+    cuts = []
+    last = 0
+    while height - last > tile_height + window:
+        target = last + tile_height
+        lo, hi = target - window, min(height - 1, target + window)
+        cut = lo + int(np.argmin(darkness[lo:hi]))
+        cuts.append(cut)
+        last = cut
+    return cuts
+
+
+def _tile(img) -> list:
+    """Cut a PIL image into tiles if it is tall, else return [img]."""
+    import numpy as np
+
+    if not _is_tall(img.width, img.height):
+        return [img]
+    tile_height = max(1, int(img.width * TILE_HEIGHT_RATIO))
+    cuts = _cut_rows(np.asarray(img.convert("L")), tile_height)
+    bounds = [0] + cuts + [img.height]
+    return [img.crop((0, top, img.width, bottom)) for top, bottom in zip(bounds, bounds[1:])]
+
+
+def split_image(image_path: Path, output_dir: Path) -> List[Path]:
+    """Write each frame/tile of `image_path` as `<stem>_page_NNNN.png` into `output_dir`.
+
+    Returns:
+        Page image paths in reading order
+
+    Raises:
+        MarkerError: If the image cannot be read
+    """
+    try:
+        from PIL import Image, ImageSequence
+    except ImportError:
+        raise MarkerError("Pillow library not installed. Install with: pip install Pillow")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pages: List[Path] = []
+    try:
+        with Image.open(image_path) as img:
+            frames = getattr(img, "n_frames", 1)
+            logger.info(f"Splitting {image_path.name}: {frames} frame(s), {img.width}x{img.height}")
+            for frame in ImageSequence.Iterator(img):
+                mode = "L" if frame.mode in ("1", "L", "I;16", "I") else "RGB"
+                for tile in _tile(frame.convert(mode)):
+                    page_path = output_dir / f"{image_path.stem}_page_{len(pages) + 1:04d}.png"
+                    tile.save(page_path, format="PNG", compress_level=1)
+                    pages.append(page_path)
+    except Exception as e:
+        logger.error(f"Image splitting failed for {image_path}: {e}")
+        raise MarkerError(f"Failed to split image {image_path.name}: {str(e)}")
+
+    logger.info(f"Split {image_path.name} into {len(pages)} page images")
+    return pages
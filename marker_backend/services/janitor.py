@@ -0,0 +1,129 @@
+"""Background garbage collection of the temp tree.
+
+Every JANITOR_INTERVAL_SEC the janitor walks the top-level entries of each directory
+in RETENTION_POLICIES and removes, oldest first:
+1. entries older than max_age_hours
+2. entries beyond max_entries
+3. entries until the directory is back under max_bytes
+
+Entries that belong to a running job (see `active_jobs`) are never removed.
+Reclaimed bytes and removed entries are reported through `metrics`.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+
+from ..core.config import RETENTION_POLICIES, JANITOR_INTERVAL_SEC
+from ..core.logger import get_logger
+from ..core.metrics import metrics
+from ..utils.path_utils import newest_mtime, path_size, remove_path
+from .active_jobs import active_jobs
+from .search_index import search_index
+
+logger = get_logger(__name__)
+
+
+def _scan(directory: Path) -> List[Tuple[Path, float, int]]:
+    """Return (path, newest_mtime, size) for each entry in `directory`, oldest first."""
+    entries = []
+    if not directory.exists():
+        return entries
+    for entry in directory.iterdir():
+        try:
+            entries.append((entry, newest_mtime(entry), path_size(entry)))
+        except OSError as e:
+            # Entry vanished or is unreadable; the next run will see it again
+            logger.debug(f"Janitor could not stat {entry}: {e}")
+    entries.sort(key=lambda e: e[1])
+    return entries
+
+
+def clean_directory(name: str, policy: dict, now: Optional[float] = None) -> Dict[str, int]:
+    """Apply one retention policy. Returns {"removed": n, "reclaimed_bytes": b, "bytes": remaining}."""
+    now = time.time() if now is None else now
+    entries = _scan(policy["path"])
+    total_bytes = sum(size for _, _, size in entries)
+    count = len(entries)
+    max_age = policy["max_age_hours"] * 3600
+    removed = reclaimed = 0
+
+    for path, mtime, size in entries:
+        expired = max_age > 0 and now - mtime > max_age
+        over_count = policy["max_entries"] > 0 and count > policy["max_entries"]
+        over_bytes = policy["max_bytes"] > 0 and total_bytes > policy["max_bytes"]
+        if not (expired or over_count or over_bytes):
+            continue
+        if active_jobs.is_active(path):
+            logger.debug(f"Janitor skipping in-flight entry {path}")
+            continue
+        try:
+            remove_path(path)
+        except OSError as e:
+            logger.warning(f"Janitor failed to remove {path}: {e}")
+            continue
+        if name == "outputs":
+            # Output folders are named after the document; drop its search entries too
+            search_index.remove_document(path.name)
+        removed += 1
+        reclaimed += size
+        count -= 1
+        total_bytes -= size
+        logger.debug(f"Janitor removed {path} ({size} bytes)")
+
+    metrics.set(f"janitor.{name}.bytes", total_bytes)
+    metrics.set(f"janitor.{name}.entries", count)
+    if removed:
+        metrics.inc(f"janitor.{name}.removed_entries", removed)
+        metrics.inc(f"janitor.{name}.reclaimed_bytes", reclaimed)
+        logger.info(f"Janitor reclaimed {reclaimed} bytes from {removed} entries in {name}")
+    return {"removed": removed, "reclaimed_bytes": reclaimed, "bytes": total_bytes}
+
+
+def run_once(policies: Dict[str, dict] = RETENTION_POLICIES) -> Dict[str, Dict[str, int]]:
+    """Run every retention policy once and return the per-directory results."""
+    start = time.time()
+    results = {}
+    for name, policy in policies.items():
+        try:
+            results[name] = clean_directory(name, policy)
+        except Exception as e:  # noqa: BLE001
+            logger.exception(f"Janitor failed for {name}: {e}")
+    reclaimed = sum(r["reclaimed_bytes"] for r in results.values())
+    metrics.inc("janitor.runs")
+    metrics.inc("janitor.reclaimed_bytes", reclaimed)
+    metrics.set("janitor.last_run_timestamp", time.time())
+    metrics.observe("janitor.run_seconds", time.time() - start)
+    return results
+
+
+class Janitor:
+    """Daemon thread calling `run_once` every `interval` seconds until stopped."""
+
+    def __init__(self, interval: int = JANITOR_INTERVAL_SEC):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            run_once()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="temp-janitor", daemon=True)
+        self._thread.start()
+        logger.info(f"Started temp janitor (interval={self.interval}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+janitor = Janitor()
@@ -0,0 +1,351 @@
+"""Write-ahead journal of document conversion jobs.
+
+Every job started by the per-page workflow (PDFs, multi-frame and tall images) is
+recorded in JOB_JOURNAL_PATH (SQLite) together with its pages and each state
+transition, before the work it describes is done:
+
+    jobs(job_id, kind, source_path, params, state, attempts, owner, heartbeat, ...)
+        state: running -> done | failed
+    pages(job_id, page, image, page_class, state, markdown, report, failures)
+        state: pending -> running -> done | failed
+    events(job_id, page, state, detail, ts)      append-only transition log
+
+A running job is leased to the process that runs it: `owner` identifies the
+process (host:pid:instance) and `heartbeat` is renewed every JOB_LEASE_SEC / 3 while
+it works. If the process dies mid-conversion, its jobs are picked up by the next
+process that finds their lease expired, or their owner gone from this host (see
+services.job_recovery): pages already done are reused from the journal and
+processing continues with the next pending page. Failed pages are run again until
+they failed JOB_RESUME_MAX_ATTEMPTS times. Taking a job over is a single
+conditional UPDATE, so two processes can never both claim it.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from ..core.config import JOB_JOURNAL_ENABLED, JOB_JOURNAL_PATH, JOB_LEASE_SEC, JOB_RESUME_MAX_ATTEMPTS
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source_path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    result TEXT,
+    owner TEXT,
+    heartbeat REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    job_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    image TEXT NOT NULL,
+    page_class TEXT,
+    state TEXT NOT NULL,
+    markdown TEXT,
+    report TEXT,
+    failures INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    PRIMARY KEY (job_id, page)
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    page INTEGER,
+    state TEXT NOT NULL,
+    detail TEXT,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+# Columns added after the first release: (table, column, definition)
+MIGRATIONS = (
+    ("jobs", "owner", "TEXT"),
+    ("jobs", "heartbeat", "REAL"),
+    ("pages", "failures", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+
+class JobJournal:
+    """Thread-safe SQLite journal; every call is a no-op when the journal is disabled."""
+
+    def __init__(
+        self, path: Path = JOB_JOURNAL_PATH, enabled: bool = JOB_JOURNAL_ENABLED, lease_sec: float = JOB_LEASE_SEC
+    ):
+        self.path = path
+        self.enabled = enabled
+        self.lease_sec = lease_sec
+        self.instance = uuid.uuid4().hex[:8]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{self.instance}"
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: a transition reported as written must survive a crash
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(SCHEMA)
+            for table, column, definition in MIGRATIONS:
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            self._conn = conn
+        return self._conn
+
+    def _write(self, statements: List[Tuple[str, tuple]]):
+        """Run statements in one transaction. Journal failures are logged, never raised."""
+        if not self.enabled:
+            return
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.warning(f"Job journal write failed: {e}")
+
+    def _read(self, sql: str, params: tuple = ()) -> List[tuple]:
+        if not self.enabled:
+            return []
+        with self._lock:
+            try:
+                return self._connection().execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Job journal read failed: {e}")
+                return []
+
+    @staticmethod
+    def _event(job_id: str, state: str, page: Optional[int] = None, detail: Optional[str] = None):
+        return (
+            "INSERT INTO events (job_id, page, state, detail, ts) VALUES (?, ?, ?, ?, ?)",
+            (job_id, page, state, detail, time.time()),
+        )
+
+    def _ensure_heartbeat(self):
+        """Start the thread renewing the leases of this process' running jobs."""
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._renew_leases, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(max(1.0, self.lease_sec / 3))
+            self._write([
+                (
+                    "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND state = 'running'",
+                    (time.time(), self.owner),
+                ),
+            ])
+
+    def start_job(self, job_id: str, kind: str, source_path: Path, params: dict):
+        """Record a new (or resumed) job as running, leased to this process."""
+        if not self.enabled:
+            return
+        now = time.time()
+        self._write([
+            (
+                "INSERT INTO jobs (job_id, kind, source_path, params, state, owner, heartbeat, created, updated) "
+                "VALUES (?, ?, ?, ?, 'running', ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET state = 'running', owner = excluded.owner, "
+                "heartbeat = excluded.heartbeat, updated = excluded.updated",
+                (job_id, kind, str(source_path), json.dumps(params), self.owner, now, now, now),
+            ),
+            self._event(job_id, "running", detail=self.owner),
+        ])
+        self._ensure_heartbeat()
+
+    def record_pages(self, job_id: str, pages: List[Tuple[int, Path, Optional[dict]]]):
+        """Register rendered pages as pending. Pages already journaled keep their state."""
+        now = time.time()
+        statements = [
+            (
+                "INSERT INTO pages (job_id, page, image, page_class, state, updated) "
+                "VALUES (?, ?, ?, ?, 'pending', ?) "
+                "ON CONFLICT(job_id, page) DO UPDATE SET image = excluded.image",
+                (job_id, page, str(image), json.dumps(page_class) if page_class else None, now),
+            )
+            for page, image, page_class in pages
+        ]
+        statements.append(self._event(job_id, "rendered", detail=f"{len(pages)} pages"))
+        self._write(statements)
+
+    def page_started(self, job_id: str, page: int):
+        self._write([
+            (
+                "UPDATE pages SET state = 'running', updated = ? WHERE job_id = ? AND page = ?",
+                (time.time(), job_id, page),
+            ),
+            self._event(job_id, "running", page),
+        ])
+
+    def page_finished(self, job_id: str, page: int, markdown: str, report: dict):
+        """Store a finished page's markdown and report; state is failed if the report has an error."""
+        state = "failed" if report.get("error") else "done"
+        self._write([
+            (
+                "UPDATE pages SET state = ?, markdown = ?, report = ?, failures = failures + ?, updated = ? "
+                "WHERE job_id = ? AND page = ?",
+                (state, markdown, json.dumps(report), int(state == "failed"), time.time(), job_id, page),
+            ),
+            self._event(job_id, state, page),
+        ])
+
+    def finish_job(self, job_id: str, state: str, result: Optional[str] = None):
+        """Mark a job done (result: output path) or failed (result: error message)."""
+        self._write([
+            (
+                "UPDATE jobs SET state = ?, result = ?, updated = ? WHERE job_id = ?",
+                (state, result, time.time(), job_id),
+            ),
+            self._event(job_id, state, detail=result),
+        ])
+
+    def claim(self, job: dict) -> bool:
+        """Take over an unfinished job whose lease expired. Returns False if another process got it.
+
+        The lease is compared and swapped in one UPDATE: it only succeeds if the job still
+        has the owner and heartbeat `job` was read with.
+        """
+        if not self.enabled:
+            return False
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    cur = conn.execute(
+                        "UPDATE jobs SET owner = ?, heartbeat = ?, updated = ? "
+                        "WHERE job_id = ? AND state = 'running' AND owner IS ? AND heartbeat IS ?",
+                        (self.owner, now, now, job["job_id"], job["owner"], job["heartbeat"]),
+                    )
+                    if cur.rowcount != 1:
+                        return False
+                    conn.execute(*self._event(job["job_id"], "claimed", detail=f"{job['owner']} -> {self.owner}"))
+            except sqlite3.Error as e:
+                logger.warning(f"Job journal claim failed: {e}")
+                return False
+        self._ensure_heartbeat()
+        return True
+
+    def _owner_alive(self, owner: str) -> Optional[bool]:
+        """Whether the process behind `owner` still runs; None if that cannot be told from here."""
+        host, pid, instance = (owner.split(":") + ["", "", ""])[:3]
+        if host != socket.gethostname() or not pid.isdigit():
+            return None
+        if int(pid) == os.getpid():
+            # Same pid (e.g. pid 1 in a restarted container): alive only if it is this journal
+            return instance == self.instance
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return None
+        return True
+
+    def lease_expired(self, job: dict, now: Optional[float] = None) -> bool:
+        """Whether `job` (from `unfinished_jobs`) may be taken over by this process."""
+        if job["owner"] == self.owner:
+            return False
+        if job["owner"] and self._owner_alive(job["owner"]) is False:
+            return True
+        now = time.time() if now is None else now
+        return job["heartbeat"] is None or now - job["heartbeat"] > self.lease_sec
+
+    def mark_resumed(self, job_id: str):
+        self._write([
+            ("UPDATE jobs SET attempts = attempts + 1, updated = ? WHERE job_id = ?", (time.time(), job_id)),
+            self._event(job_id, "resumed"),
+        ])
+
+    def unfinished_jobs(self) -> List[dict]:
+        """Return jobs marked running (by any process), oldest first; see `lease_expired`."""
+        rows = self._read(
+            "SELECT job_id, kind, source_path, params, attempts, owner, heartbeat FROM jobs "
+            "WHERE state = 'running' ORDER BY created"
+        )
+        return [
+            {
+                "job_id": j,
+                "kind": k,
+                "source_path": Path(s),
+                "params": json.loads(p),
+                "attempts": a,
+                "owner": o,
+                "heartbeat": h,
+            }
+            for j, k, s, p, a, o, h in rows
+        ]
+
+    def pages(self, job_id: str) -> List[dict]:
+        """Return the journaled pages of a job in page order."""
+        rows = self._read(
+            "SELECT page, image, page_class, state, markdown, report, failures FROM pages "
+            "WHERE job_id = ? ORDER BY page",
+            (job_id,),
+        )
+        return [
+            {
+                "page": page,
+                "image": Path(image),
+                "page_class": json.loads(page_class) if page_class else None,
+                "state": state,
+                "markdown": markdown,
+                "report": json.loads(report) if report else None,
+                "failures": failures,
+            }
+            for page, image, page_class, state, markdown, report, failures in rows
+        ]
+
+    def completed_pages(self, job_id: str, max_failures: int = JOB_RESUME_MAX_ATTEMPTS) -> Dict[int, Tuple[str, dict]]:
+        """Return {page: (markdown, report)} for pages a previous run already finished.
+
+        Failed pages are processed again, and only reused (with their error stub) once
+        they failed `max_failures` times.
+        """
+        return {
+            p["page"]: (p["markdown"] or "", p["report"] or {})
+            for p in self.pages(job_id)
+            if p["state"] == "done" or (p["state"] == "failed" and p["failures"] >= max_failures)
+        }
+
+    def prune(self, max_age_hours: float) -> int:
+        """Delete finished jobs (and their pages/events) older than `max_age_hours`."""
+        if max_age_hours <= 0:
+            return 0
+        cutoff = time.time() - max_age_hours * 3600
+        old = [row[0] for row in self._read(
+            "SELECT job_id FROM jobs WHERE state != 'running' AND updated < ?", (cutoff,)
+        )]
+        statements = []
+        for job_id in old:
+            for table in ("pages", "events", "jobs"):
+                statements.append((f"DELETE FROM {table} WHERE job_id = ?", (job_id,)))
+        if statements:
+            self._write(statements)
+        return len(old)
+
+
+job_journal = JobJournal()
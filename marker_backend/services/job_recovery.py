@@ -0,0 +1,129 @@
+"""Resume conversion jobs interrupted by a process restart.
+
+On startup, jobs the journal still records as running and whose lease expired
+(their process died) are claimed and continued in a background thread, one at a
+time, from their next pending page. Jobs still leased by a live process (another
+uvicorn worker, or the old process during an overlapping restart) are left alone;
+the thread checks them again every JOB_LEASE_SEC until none remain. Jobs whose
+upload is gone, or that already took the process down JOB_RESUME_MAX_ATTEMPTS
+times, are marked failed and their leftover page images removed.
+"""
+
+from pathlib import Path
+from typing import List, Tuple
+import shutil
+import threading
+import time
+
+from ..core.config import (
+    JOB_JOURNAL_ENABLED,
+    JOB_JOURNAL_MAX_AGE_HOURS,
+    JOB_LEASE_SEC,
+    JOB_RESUME_MAX_ATTEMPTS,
+)
+from ..core.exceptions import MarkerError
+from ..core.logger import get_logger, log_context
+from ..core.metrics import metrics
+from .active_jobs import active_jobs
+from .job_journal import job_journal
+from .pdf_converter import resume_job
+
+logger = get_logger(__name__)
+
+
+def _job_paths(job: dict) -> Tuple[Path, Path, Path]:
+    """Return (source, page image folder, document output folder) of a journaled job."""
+    params = job["params"]
+    source_path: Path = job["source_path"]
+    return (
+        source_path,
+        Path(params["image_base_dir"]) / params["temp_image_subdir"],
+        Path(params["output_dir"]) / source_path.stem,
+    )
+
+
+def _abandon(job: dict, reason: str):
+    logger.warning(f"Not resuming job {job['job_id']} ({job['source_path'].name}): {reason}")
+    job_journal.finish_job(job["job_id"], "failed", reason)
+    metrics.inc("jobs.abandoned")
+    if not job["params"].get("keep_images"):
+        shutil.rmtree(_job_paths(job)[1], ignore_errors=True)
+
+
+def _resume_all(jobs: List[dict]):
+    for job in jobs:
+        paths = _job_paths(job)
+        try:
+            with log_context(job_id=job["job_id"], stage="resume"):
+                logger.info(f"Resuming {job['kind']} job {job['job_id']} for {job['source_path'].name}")
+                job_journal.mark_resumed(job["job_id"])
+                output = resume_job(job)
+                metrics.inc("jobs.resumed")
+                logger.info(f"Resumed job {job['job_id']} completed: {output}")
+        except MarkerError as e:
+            metrics.inc("jobs.resume_failed")
+            logger.error(f"Resumed job {job['job_id']} failed: {e}")
+        except Exception:
+            metrics.inc("jobs.resume_failed")
+            logger.exception(f"Unexpected error resuming job {job['job_id']}")
+        finally:
+            active_jobs.release(*paths)
+
+
+def _claim_expired() -> Tuple[List[dict], int]:
+    """Claim running jobs whose lease expired. Returns (claimed jobs to resume, jobs leased elsewhere)."""
+    jobs = []
+    leased = 0
+    for job in job_journal.unfinished_jobs():
+        if not job_journal.lease_expired(job):
+            if job["owner"] != job_journal.owner:
+                leased += 1
+            continue
+        if not job_journal.claim(job):
+            continue  # another process claimed it first
+        if job["attempts"] >= JOB_RESUME_MAX_ATTEMPTS:
+            _abandon(job, f"interrupted {job['attempts']} times")
+        elif not job["source_path"].exists():
+            _abandon(job, "source file no longer exists")
+        else:
+            jobs.append(job)
+    for job in jobs:
+        active_jobs.acquire(*_job_paths(job))
+    return jobs, leased
+
+
+def _watch_leases(jobs: List[dict], leased: int):
+    """Resume `jobs`, then keep taking over jobs whose owner stops renewing its lease."""
+    _resume_all(jobs)
+    while leased:
+        time.sleep(JOB_LEASE_SEC)
+        jobs, leased = _claim_expired()
+        if jobs:
+            logger.info(f"Taking over {len(jobs)} jobs whose lease expired")
+            _resume_all(jobs)
+
+
+def resume_unfinished_jobs(background: bool = True) -> List[str]:
+    """Pick up jobs left running by a process that is gone. Returns the ids of jobs being resumed.
+
+    The jobs' files are registered with `active_jobs` before returning, so the janitor
+    started afterwards does not remove them while they wait their turn. Without
+    `background` only jobs whose lease already expired are resumed, in the caller's thread.
+    """
+    if not JOB_JOURNAL_ENABLED:
+        return []
+    pruned = job_journal.prune(JOB_JOURNAL_MAX_AGE_HOURS)
+    if pruned:
+        logger.info(f"Pruned {pruned} finished jobs from the job journal")
+
+    jobs, leased = _claim_expired()
+    if leased:
+        logger.info(f"{leased} running jobs are leased by another process; checking them every {JOB_LEASE_SEC:g}s")
+    if jobs:
+        logger.info(f"Resuming {len(jobs)} unfinished jobs from the job journal")
+    if background:
+        if jobs or leased:
+            threading.Thread(target=_watch_leases, args=(jobs, leased), name="job-resume", daemon=True).start()
+    else:
+        _resume_all(jobs)
+    return [job["job_id"] for job in jobs]
@@ -1,6 +1,7 @@
 import subprocess
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
 from ..core.config import (
     MARKER_CLI,
     MARKER_FLAGS,
@@ -10,29 +11,194 @@ from ..core.config import (
     GPU_MEM_FREE_MB,
     GPU_WAIT_TIMEOUT_SEC,
     GPU_POLL_INTERVAL_SEC,
+    BATCH_OOM_MAX_RETRIES,
 )
-from ..core.logger import get_logger
-from ..core.exceptions import MarkerError
+from ..core.logger import get_logger, save_job_output, truncate_output
+from ..core.profiling import span
+from ..core.exceptions import MarkerError, MarkerCancelled
+from .batch_tuner import batch_tuner, is_oom_error, marker_config_file
+from .cpu_planner import cpu_planner, set_affinity
 import shlex
+import shutil
+import sys
+import threading
 import time
 import os
 
 logger = get_logger(__name__)
 
+# Flags (with one argument each) that run_marker_for_chunk sets itself
+MANAGED_FLAGS = ("--output_dir", "--config_json")
+# How often a cancellable Marker run checks its token
+CANCEL_POLL_SEC = 0.25
+# Prints the module paths of Marker's default PDF processors, one per line
+DEFAULT_PROCESSORS_SCRIPT = (
+    "from marker.converters.pdf import PdfConverter\n"
+    "for p in PdfConverter.default_processors: print(f'{p.__module__}.{p.__name__}')"
+)
+
+
+class CancelToken:
+    """Lets another thread stop a Marker run.
+
+    `started` is set (and `started_at` recorded) once the subprocess launched, i.e. after
+    any wait for a CPU slot, so callers can time the run itself rather than its queueing.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self.started = threading.Event()
+        self.started_at: Optional[float] = None
+
+    def mark_started(self):
+        if self.started_at is None:
+            self.started_at = time.time()
+        self.started.set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+
+def _run_process(
+    cmd: List[str], env: dict, cancel: Optional[CancelToken], cpus: Optional[List[int]] = None
+) -> subprocess.CompletedProcess:
+    """Run `cmd` to completion, killing it if `cancel` is triggered.
+
+    Args:
+        cpus: CPU ids to pin the process to (CPU planner affinity)
+
+    Raises:
+        MarkerCancelled: If the run was cancelled
+    """
+    if cancel is None and not cpus:
+        return subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if cancel is not None and cancel.is_cancelled():
+        raise MarkerCancelled(f"Marker run cancelled before start: {cmd[1]}")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+    set_affinity(proc.pid, cpus)
+    if cancel is None:
+        stdout, stderr = proc.communicate()
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+    cancel.mark_started()
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=CANCEL_POLL_SEC)
+            return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            if cancel.is_cancelled():
+                proc.kill()
+                proc.communicate()
+                raise MarkerCancelled(f"Marker run cancelled: {cmd[1]}")
+
+
+def _user_config_path(flags: List[str]) -> Optional[Path]:
+    """Return the --config_json file given in `flags`, if any."""
+    if "--config_json" in flags:
+        i = flags.index("--config_json")
+        if i + 1 < len(flags):
+            return Path(flags[i + 1])
+    return None
+
+
+def _filter_managed_flags(flags: List[str]) -> List[str]:
+    """Return `flags` without MANAGED_FLAGS and their arguments."""
+    filtered_flags = []
+    skip_next = False
+    for flag in flags:
+        if skip_next:
+            skip_next = False
+            continue
+        if flag in MANAGED_FLAGS:
+            skip_next = True  # Skip the next item (the path argument)
+            continue
+        filtered_flags.append(flag)
+    return filtered_flags
+
+
+def _marker_python() -> str:
+    """Return the interpreter of the Marker CLI script (its shebang), else this one."""
+    cli = shutil.which(MARKER_CLI)
+    if cli:
+        try:
+            with open(cli, "rb") as f:
+                first = f.readline().decode("utf-8", "replace").strip()
+        except OSError:
+            first = ""
+        if first.startswith("#!") and "python" in first:
+            return first[2:].strip().split()[0]
+    return sys.executable
+
+
+@lru_cache(maxsize=None)
+def _default_processors() -> Tuple[str, ...]:
+    """Module paths of Marker's default processors, read from the Marker installation once.
+
+    Runs in a separate interpreter so this process does not import torch. Returns ()
+    if Marker cannot be inspected (profiles then run the full pipeline).
+    """
+    try:
+        res = subprocess.run(
+            [_marker_python(), "-c", DEFAULT_PROCESSORS_SCRIPT], capture_output=True, text=True, timeout=300
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not list Marker processors, running the full pipeline: {e}")
+        return ()
+    if res.returncode != 0:
+        logger.warning(
+            f"Could not list Marker processors, running the full pipeline: {truncate_output(res.stderr)}"
+        )
+        return ()
+    return tuple(line.strip() for line in res.stdout.splitlines() if line.strip())
+
 
-def run_marker_for_chunk(chunk_path: Path, output_dir: Path = None) -> Path:
+def _processor_flags(flags: List[str], skip_processors: Optional[Sequence[str]]) -> List[str]:
+    """Return `flags` with a --processors list that leaves out `skip_processors` (class names).
+
+    An explicit --processors list in `flags` is filtered; otherwise Marker's defaults are.
+    """
+    if not skip_processors:
+        return flags
+    skip = set(skip_processors)
+    if "--processors" in flags:
+        i = flags.index("--processors")
+        processors = flags[i + 1].split(",") if i + 1 < len(flags) else []
+        flags = flags[:i] + flags[i + 2:]
+    else:
+        processors = list(_default_processors())
+        if not processors:
+            return flags
+    kept = [p for p in processors if p.rsplit(".", 1)[-1] not in skip]
+    return flags + ["--processors", ",".join(kept)]
+
+
+def run_marker_for_chunk(
+    chunk_path: Path,
+    output_dir: Path = None,
+    flags: Optional[List[str]] = None,
+    config_overrides: Optional[dict] = None,
+    skip_processors: Optional[Sequence[str]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Path:
     """Run marker on a chunk (image or PDF) and return path to markdown output.
     
     Args:
         chunk_path: Path to the input file (image or PDF)
         output_dir: Directory where marker should save outputs. 
                    If None, uses MARKER_OUTPUT_DIR from config.
+        flags: Marker flags for this run (defaults to MARKER_FLAGS), e.g. from a profile
+        config_overrides: Settings merged over MARKER_CONFIG_JSON for this run
+        skip_processors: Marker processor class names to leave out (e.g. table recognition)
+        cancel: Token another thread can use to kill the run
     
     Returns:
         Path to the extracted markdown file
     
     Raises:
         MarkerError: If marker processing fails
+        MarkerCancelled: If the run was cancelled through `cancel`
     """
     if output_dir is None:
         output_dir = OUTPUTS_DIR
@@ -43,52 +209,82 @@ def run_marker_for_chunk(chunk_path: Path, output_dir: Path = None) -> Path:
     env = os.environ.copy()
 
     # Wait for GPU to be in a safe state before launching heavy processing
-    try:
+    with span("gpu_wait"):
         wait_for_gpu_ready()
-    except MarkerError:
-        # re-raise to stop processing
-        raise
 
     # Build command with custom output directory
-    # Filter out any existing --output_dir flags and their arguments
-    filtered_flags = []
-    skip_next = False
-    for i, flag in enumerate(MARKER_FLAGS):
-        if skip_next:
-            skip_next = False
-            continue
-        if flag == "--output_dir":
-            skip_next = True  # Skip the next item (the path argument)
-            continue
-        filtered_flags.append(flag)
-    
-    cmd = [MARKER_CLI, str(chunk_path), "--output_dir", str(output_dir)] + filtered_flags
+    # Filter out any existing --output_dir/--config_json flags and their arguments
+    flags = MARKER_FLAGS if flags is None else flags
+    filtered_flags = _filter_managed_flags(flags)
+    filtered_flags = _processor_flags(filtered_flags, skip_processors)
 
-    logger.info(f"Starting Marker for {chunk_path} with cmd: {' '.join(shlex.quote(p) for p in cmd)}")
-    start = time.time()
-    res = subprocess.run(cmd, capture_output=True, text=True, env=env)
-    duration = time.time() - start
-
-    # Log summary info at INFO and full outputs at DEBUG so app.log captures details
-    logger.info(
-        "Marker finished for %s (exit=%s) in %.2fs",
-        chunk_path,
-        res.returncode,
-        duration,
-    )
-    logger.debug("Marker stdout for %s:\n%s", chunk_path, res.stdout or "<no stdout>")
-    logger.debug("Marker stderr for %s:\n%s", chunk_path, res.stderr or "<no stderr>")
+    # A --config_json from the flags is merged into the config written for this run;
+    # batch sizes are scaled to the free GPU memory and halved on CUDA OOM
+    plan = batch_tuner.plan(config_overrides, user_config=_user_config_path(flags))
+    oom_retries = 0
+    while True:
+        # The config file lives only as long as this attempt
+        with marker_config_file(plan.config) as config_path:
+            cmd = [MARKER_CLI, str(chunk_path), "--output_dir", str(output_dir)] + filtered_flags
+            if config_path is not None:
+                cmd += ["--config_json", str(config_path)]
+
+            logger.info(f"Starting Marker for {chunk_path} with cmd: {' '.join(shlex.quote(p) for p in cmd)}")
+            start = time.time()
+            # On CPU hosts each run holds a slot of the CPU plan: its share of the cores as
+            # thread counts (and affinity), which also bounds how many runs share the CPU
+            with cpu_planner.slot() as slot, span("marker", file=chunk_path.name, attempt=oom_retries + 1):
+                run_env = env if slot is None else slot.env(env)
+                res = _run_process(cmd, run_env, cancel, slot.cpus if slot is not None else None)
+        duration = time.time() - start
+
+        # Log summary info at INFO and (truncated) outputs at DEBUG; jobs that asked for
+        # full output get the complete stdout/stderr under logs/jobs/<job_id>/
+        logger.info(
+            "Marker finished for %s (exit=%s) in %.2fs",
+            chunk_path,
+            res.returncode,
+            duration,
+        )
+        logger.debug("Marker stdout for %s:\n%s", chunk_path, truncate_output(res.stdout) or "<no stdout>")
+        logger.debug("Marker stderr for %s:\n%s", chunk_path, truncate_output(res.stderr) or "<no stderr>")
+        save_job_output(f"{chunk_path.stem}.attempt{oom_retries + 1}.stdout.log", res.stdout)
+        save_job_output(f"{chunk_path.stem}.attempt{oom_retries + 1}.stderr.log", res.stderr)
+
+        if res.returncode == 0:
+            batch_tuner.record_success(plan)
+            break
+        if not is_oom_error(res.stderr) or oom_retries >= BATCH_OOM_MAX_RETRIES:
+            break
+        retry_plan = batch_tuner.record_oom(plan)
+        if retry_plan is None:
+            break
+        plan = retry_plan
+        oom_retries += 1
+        # Give the device a moment to release the failed process' memory
+        with span("gpu_wait"):
+            wait_for_gpu_ready()
 
     if res.returncode != 0:
         logger.error("Marker failed for %s (exit=%s). See stderr in logs.", chunk_path, res.returncode)
         # ensure stderr is available in the exception message for immediate feedback
-        raise MarkerError(f"Marker failed for {chunk_path}: {res.stderr}")
+        raise MarkerError(f"Marker failed for {chunk_path}: {truncate_output(res.stderr)}")
     
     # If marker outputs to stdout or writes file elsewhere, try to discover the produced markdown.
     # First, check the canonical out_path
     if out_path.exists():
         return out_path
 
+    with span("discovery"):
+        return _discover_output(chunk_path, output_dir, res)
+
+
+def _discover_output(chunk_path: Path, output_dir: Path, res: subprocess.CompletedProcess) -> Path:
+    """Find the markdown Marker produced when it is not at the canonical path.
+
+    Raises:
+        MarkerError: If no markdown output can be found
+    """
     logger.debug("Expected output not found at canonical path; attempting discovery heuristics.")
     
     # Look for the markdown file in the output directory or as a directory with .md file inside
@@ -161,7 +357,7 @@ def run_marker_for_chunk(chunk_path: Path, output_dir: Path = None) -> Path:
                 return chosen
 
     # Nothing found
-    logger.error("Marker finished but no markdown output discovered; stdout/stderr below:\n%s", text)
+    logger.error("Marker finished but no markdown output discovered; stdout/stderr below:\n%s", truncate_output(text))
     raise MarkerError(f"Expected markdown output not found after Marker run for {chunk_path}")
 
 
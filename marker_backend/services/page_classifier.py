@@ -0,0 +1,214 @@
+"""Fast per-page complexity classification.
+
+Looks at a PyMuPDF page (text layer and vector drawings) and at its rendered pixmap
+(ink coverage and long horizontal/vertical rules) to decide which Marker processing
+profile a page needs:
+
+- "blank": nothing on the page, Marker is skipped entirely
+- "table": ruled grid or rows of column-aligned text, processed with the full profile
+- "text": a text layer with neither, processed with the cheaper text profile
+- "unsure": no text layer to rule out a borderless table, processed with the full profile
+
+Only the "text" kind skips table recognition, so a page is sent there only when its
+text layer shows prose rather than columns. Standalone images (TIFF frames, image
+tiles) have no text layer and so are never routed to the text profile.
+"""
+
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+from ..core.config import (
+    PAGE_BLANK_INK_RATIO,
+    PAGE_TABLE_MIN_HLINES,
+    PAGE_TABLE_MIN_VLINES,
+    PAGE_TABLE_MIN_ALIGNED_ROWS,
+)
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Pixmaps are sampled down by this step in both axes before analysis
+SAMPLE_STEP = 4
+# Gray level below which a pixel counts as ink
+INK_THRESHOLD = 160
+# Fraction of a row (column) that must be ink for it to count as a ruling line
+HLINE_COVERAGE = 0.5
+VLINE_COVERAGE = 0.3
+# Words whose vertical centres are this close (in points) are on the same visual row
+ROW_TOLERANCE = 3.0
+# A horizontal gap wider than this many line heights separates two columns
+COLUMN_GAP_LINE_HEIGHTS = 2.0
+
+
+@dataclass
+class PageClass:
+    """Classification result for one page."""
+
+    kind: str
+    profile: Optional[str]
+    text_chars: int = 0
+    ink_ratio: float = 0.0
+    hlines: int = 0
+    vlines: int = 0
+    aligned_rows: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _count_runs(mask) -> int:
+    """Count runs of consecutive True values in a 1-D boolean array."""
+    import numpy as np
+
+    if mask.size == 0:
+        return 0
+    padded = np.concatenate(([False], mask, [False]))
+    return int(np.count_nonzero(padded[1:] & ~padded[:-1]))
+
+
+def _pixmap_stats(pix):
+    """Return (ink_ratio, hlines, vlines) for a rendered pixmap."""
+    import numpy as np
+
+    samples = np.frombuffer(pix.samples, dtype=np.uint8)
+    img = samples.reshape(pix.height, pix.width, pix.n)[::SAMPLE_STEP, ::SAMPLE_STEP]
+    gray = img[..., :3].mean(axis=2) if pix.n >= 3 else img[..., 0]
+    return _gray_stats(gray)
+
+
+def _gray_stats(gray):
+    """Return (ink_ratio, hlines, vlines) for a (sampled) grayscale array."""
+    ink = gray < INK_THRESHOLD
+    if ink.size == 0:
+        return 0.0, 0, 0
+    hlines = _count_runs(ink.mean(axis=1) >= HLINE_COVERAGE)
+    vlines = _count_runs(ink.mean(axis=0) >= VLINE_COVERAGE)
+    return float(ink.mean()), hlines, vlines
+
+
+def _vector_line_stats(page):
+    """Return (hlines, vlines) counted from the page's vector drawings."""
+    hlines = vlines = 0
+    try:
+        drawings = page.get_drawings()
+    except Exception as e:
+        logger.debug(f"Could not read drawings for page {page.number + 1}: {e}")
+        return 0, 0
+    min_len = page.rect.width * 0.1
+    for drawing in drawings:
+        for item in drawing.get("items", []):
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) < 1 and abs(p1.x - p2.x) >= min_len:
+                    hlines += 1
+                elif abs(p1.x - p2.x) < 1 and abs(p1.y - p2.y) >= min_len / 2:
+                    vlines += 1
+            elif item[0] == "re":
+                rect = item[1]
+                # Thin rectangles are how many generators draw table rules
+                if rect.height < 2 and rect.width >= min_len:
+                    hlines += 1
+                elif rect.width < 2 and rect.height >= min_len / 2:
+                    vlines += 1
+    return hlines, vlines
+
+
+def _aligned_text_rows(page) -> int:
+    """Count visual rows of the text layer split into three or more columns by wide gaps.
+
+    Borderless tables have no rules to detect, but their rows show up as words on one
+    baseline separated by gaps much wider than a word space.
+    """
+    try:
+        words = page.get_text("words")
+    except Exception as e:
+        logger.debug(f"Could not read words for page {page.number + 1}: {e}")
+        return 0
+    rows = []
+    for x0, y0, x1, y1, *_ in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        centre = (y0 + y1) / 2
+        if rows and abs(rows[-1]["centre"] - centre) <= ROW_TOLERANCE:
+            rows[-1]["words"].append((x0, x1, y1 - y0))
+        else:
+            rows.append({"centre": centre, "words": [(x0, x1, y1 - y0)]})
+
+    aligned = 0
+    for row in rows:
+        spans = sorted(row["words"])
+        gaps = 0
+        for (_, prev_x1, height), (x0, _, _) in zip(spans, spans[1:]):
+            if x0 - prev_x1 > COLUMN_GAP_LINE_HEIGHTS * max(height, 1.0):
+                gaps += 1
+        if gaps >= 2:
+            aligned += 1
+    return aligned
+
+
+def classify_page(page, pix=None) -> PageClass:
+    """Classify a PyMuPDF page, optionally using its already rendered pixmap.
+
+    Args:
+        page: fitz.Page to classify
+        pix: Rendered fitz.Pixmap of the page (analysed for scanned pages)
+
+    Returns:
+        PageClass with the chosen kind and profile name
+    """
+    text_chars = len(page.get_text("text").strip())
+    v_h, v_v = _vector_line_stats(page)
+    aligned_rows = _aligned_text_rows(page) if text_chars else 0
+
+    ink_ratio, p_h, p_v = 0.0, 0, 0
+    if pix is not None:
+        try:
+            ink_ratio, p_h, p_v = _pixmap_stats(pix)
+        except Exception as e:
+            logger.debug(f"Pixmap analysis failed for page {page.number + 1}: {e}")
+            ink_ratio = 1.0  # be conservative: never skip a page we could not inspect
+
+    return _decide(
+        text_chars, ink_ratio if pix is not None else None, max(v_h, p_h), max(v_v, p_v), aligned_rows
+    )
+
+
+def classify_image(image_path: Path) -> PageClass:
+    """Classify a standalone page image (TIFF frame, tile) from its pixels."""
+    try:
+        import numpy as np
+        from PIL import Image
+
+        with Image.open(image_path) as img:
+            gray = np.asarray(img.convert("L"))[::SAMPLE_STEP, ::SAMPLE_STEP]
+        ink_ratio, hlines, vlines = _gray_stats(gray)
+    except Exception as e:
+        logger.debug(f"Pixel analysis failed for {image_path}: {e}")
+        return _decide(0, None, 0, 0)  # unknown ink: full profile, never skipped
+    # Without a text layer a page is only blank if it has (almost) no ink
+    return _decide(0, ink_ratio, hlines, vlines)
+
+
+def _decide(
+    text_chars: int, ink_ratio: Optional[float], hlines: int, vlines: int, aligned_rows: int = 0
+) -> PageClass:
+    if text_chars == 0 and ink_ratio is not None and ink_ratio < PAGE_BLANK_INK_RATIO:
+        kind = "blank"
+    elif hlines >= PAGE_TABLE_MIN_HLINES and vlines >= PAGE_TABLE_MIN_VLINES:
+        kind = "table"
+    elif aligned_rows >= PAGE_TABLE_MIN_ALIGNED_ROWS:
+        kind = "table"
+    elif text_chars == 0:
+        # Without a text layer a borderless table cannot be ruled out
+        kind = "unsure"
+    else:
+        kind = "text"
+
+    return PageClass(
+        kind=kind,
+        profile=None if kind == "blank" else ("text" if kind == "text" else "full"),
+        text_chars=text_chars,
+        ink_ratio=round(ink_ratio or 0.0, 5),
+        hlines=hlines,
+        vlines=vlines,
+        aligned_rows=aligned_rows,
+    )
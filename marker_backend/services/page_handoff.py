@@ -0,0 +1,183 @@
+"""Zero-disk handoff of rendered page pixels.
+
+With PAGE_HANDOFF=shm, PDF pages are not encoded to PNG in PDF2IMAGE_DIR at render
+time. The raw pixmap is copied into a `multiprocessing.shared_memory` block that
+in-process stages (preprocessing) and worker processes can map by name without
+decoding anything. Only the Marker CLI still needs a file: the page is encoded
+once, after preprocessing, into HANDOFF_DIR (tmpfs such as /dev/shm by default).
+
+Shared memory is bounded by HANDOFF_MAX_BYTES and by the free space in /dev/shm
+(less HANDOFF_SHM_RESERVE_BYTES), checked for every page: containers often mount
+a small /dev/shm (64 MB in Docker) and writing past its end kills the process with
+SIGBUS instead of raising. Pages that do not fit fall back to the PNG-on-disk path.
+"""
+
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import os
+import threading
+
+from ..core.config import HANDOFF_MAX_BYTES, HANDOFF_SHM_RESERVE_BYTES
+from ..core.logger import get_logger
+from ..core.metrics import metrics
+
+logger = get_logger(__name__)
+
+# Where POSIX shared memory blocks live on Linux
+SHM_DIR = Path("/dev/shm")
+
+
+def shm_free_bytes() -> Optional[int]:
+    """Free bytes in SHM_DIR, or None where it cannot be determined (e.g. macOS)."""
+    try:
+        st = os.statvfs(SHM_DIR)
+    except (AttributeError, OSError):
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+class SharedPage:
+    """Raw page pixels (uint8, HxWxC) held in a named shared memory block."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, int, int]):
+        self.shm = shm
+        self.shape = shape
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def nbytes(self) -> int:
+        return self.shape[0] * self.shape[1] * self.shape[2]
+
+    @classmethod
+    def from_pixmap(cls, pix) -> "SharedPage":
+        shape = (pix.height, pix.width, pix.n)
+        size = shape[0] * shape[1] * shape[2]
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        # Pixmap rows may be padded (stride); copy row by row when they are
+        if pix.stride == pix.width * pix.n:
+            shm.buf[:size] = pix.samples
+        else:
+            samples = pix.samples
+            row = pix.width * pix.n
+            for y in range(pix.height):
+                shm.buf[y * row:(y + 1) * row] = samples[y * pix.stride:y * pix.stride + row]
+        return cls(shm, shape)
+
+    @classmethod
+    def attach(cls, name: str, shape: Tuple[int, int, int]) -> "SharedPage":
+        """Map an existing block, e.g. from a worker process."""
+        return cls(shared_memory.SharedMemory(name=name), shape)
+
+    def array(self):
+        """Return a zero-copy NumPy view of the pixels."""
+        import numpy as np
+
+        return np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def to_image(self):
+        """Return a PIL image of the pixels (RGB or L).
+
+        The pixels are copied (a memcpy, no decode) so the image stays valid after
+        the shared memory block is released.
+        """
+        from PIL import Image
+
+        arr = self.array()
+        if self.shape[2] == 1:
+            return Image.fromarray(arr[..., 0].copy(), mode="L")
+        return Image.fromarray(arr[..., :3].copy(), mode="RGB")
+
+    def write_png(self, path: Path) -> Path:
+        """Encode the page for the Marker CLI (fast, low compression)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.to_image().save(path, format="PNG", compress_level=1)
+        return path
+
+    def close(self, unlink: bool = True):
+        try:
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class HandoffRegistry:
+    """Maps the page image path Marker will read to its pending shared memory pixels."""
+
+    def __init__(self, max_bytes: int = HANDOFF_MAX_BYTES, reserve_bytes: int = HANDOFF_SHM_RESERVE_BYTES):
+        self.reserve_bytes = reserve_bytes
+        free = shm_free_bytes()
+        if free is not None and free - reserve_bytes < max_bytes:
+            capped = max(0, free - reserve_bytes)
+            logger.warning(
+                f"{SHM_DIR} has {free // (1024 * 1024)} MiB free; shared memory handoff budget"
+                f" capped at {capped // (1024 * 1024)} MiB (HANDOFF_MAX_BYTES={max_bytes})"
+            )
+            max_bytes = capped
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pages: Dict[Path, SharedPage] = {}
+        self._bytes = 0
+        # Bytes of blocks being created and filled; not yet visible in the free space
+        self._pending = 0
+
+    def _fits(self, size: int) -> bool:
+        """Whether `size` more bytes fit the budget and the free space in SHM_DIR (call with the lock)."""
+        if self._bytes + size > self.max_bytes:
+            return False
+        free = shm_free_bytes()
+        return free is None or free - self._pending - size >= self.reserve_bytes
+
+    def offer(self, path: Path, pix) -> bool:
+        """Place the pixmap in shared memory for `path`. Returns False if it does not fit."""
+        size = pix.height * pix.width * pix.n
+        with self._lock:
+            if not self._fits(size):
+                metrics.inc("handoff.fallback_pages")
+                return False
+            self._bytes += size
+            self._pending += size
+        try:
+            page = SharedPage.from_pixmap(pix)
+        except Exception as e:
+            logger.warning(f"Shared memory handoff failed for {path.name}: {e}")
+            with self._lock:
+                self._bytes -= size
+                self._pending -= size
+            metrics.inc("handoff.fallback_pages")
+            return False
+        with self._lock:
+            self._pending -= size
+            self._pages[path] = page
+        metrics.inc("handoff.shm_pages")
+        metrics.inc("handoff.shm_bytes", size)
+        return True
+
+    def get(self, path: Path) -> Optional[SharedPage]:
+        with self._lock:
+            return self._pages.get(path)
+
+    def release(self, path: Path):
+        """Free the shared memory held for `path`, if any."""
+        with self._lock:
+            page = self._pages.pop(path, None)
+            if page is not None:
+                self._bytes -= page.nbytes
+        if page is not None:
+            page.close()
+
+    def materialize(self, path: Path) -> Path:
+        """Write pending pixels for `path` to disk (for the CLI) and free the shared memory."""
+        page = self.get(path)
+        if page is not None:
+            page.write_png(path)
+            self.release(path)
+        return path
+
+
+handoff = HandoffRegistry()
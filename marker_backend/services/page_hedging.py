@@ -0,0 +1,149 @@
+"""Straggler detection and hedged page runs.
+
+In a parallel document run a single pathological page (dense table, huge diagram)
+can take many times longer than the rest and hold up combining the document. The
+per-document `StragglerDetector` keeps the durations of finished pages; once a page
+has been running longer than their p95 (see PAGE_HEDGING settings) and a worker is
+idle, the page is run a second time ("hedged") on a copy of its image, optionally
+with a cheaper Marker profile (HEDGE_PROFILE) or downscaled (HEDGE_SCALE). Whichever
+run finishes first is used and the other is cancelled.
+
+Hedge rate (hedges per processed page) and win rate (hedges that finished first) are
+exported as gauges `pages.hedge_rate` and `pages.hedge_win_rate`.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+import math
+import shutil
+import time
+
+from ..core.config import (
+    HEDGE_MIN_SAMPLES,
+    HEDGE_MIN_SECONDS,
+    HEDGE_P95_MULTIPLIER,
+    HEDGE_PROFILE,
+    HEDGE_SCALE,
+    MARKER_PROFILES,
+)
+from ..core.exceptions import MarkerError
+from ..core.logger import get_logger, log_context
+from ..core.metrics import metrics
+from ..core.profiling import span
+from .marker_runner import CancelToken, run_marker_for_chunk
+
+logger = get_logger(__name__)
+
+
+class StragglerDetector:
+    """Running p95 of finished page times for one document."""
+
+    def __init__(
+        self,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        multiplier: float = HEDGE_P95_MULTIPLIER,
+        min_seconds: float = HEDGE_MIN_SECONDS,
+    ):
+        self.min_samples = min_samples
+        self.multiplier = multiplier
+        self.min_seconds = min_seconds
+        self._durations: List[float] = []
+
+    def add(self, seconds: float):
+        self._durations.append(seconds)
+
+    def threshold(self) -> Optional[float]:
+        """Seconds after which a running page counts as a straggler, or None with too few samples."""
+        if len(self._durations) < max(1, self.min_samples):
+            return None
+        ordered = sorted(self._durations)
+        p95 = ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+        return max(p95 * self.multiplier, self.min_seconds)
+
+
+@dataclass
+class HedgeResult:
+    markdown: str
+    profile: str
+    scale: float
+    seconds: float
+    work_dir: Path
+    page_dir: Optional[Path]
+
+    def discard(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def hedge_work_dir(doc_output_dir: Path, page: int) -> Path:
+    return doc_output_dir / f".hedge_{page:04d}"
+
+
+def _prepare_input(image_path: Path, dst: Path, scale: float) -> Path:
+    """Copy the page image for the hedge run, downscaled when scale < 1."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if scale >= 1.0:
+        shutil.copyfile(image_path, dst)
+        return dst
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img.resize(size, resample=Image.LANCZOS).save(dst, format="PNG", compress_level=1)
+    return dst
+
+
+def run_hedge(
+    page: int,
+    image_path: Path,
+    page_profile: str,
+    doc_output_dir: Path,
+    cancel: CancelToken,
+) -> HedgeResult:
+    """Run Marker for a straggling page on a private copy of its image.
+
+    The output lands in a private folder under the document folder so it cannot clash
+    with the original run; the caller adopts or discards it.
+
+    Raises:
+        MarkerError: If the run fails or is cancelled
+    """
+    profile = HEDGE_PROFILE if HEDGE_PROFILE in MARKER_PROFILES else page_profile
+    work_dir = hedge_work_dir(doc_output_dir, page)
+    start = time.time()
+    metrics.inc("pages.hedge.launched")
+    with log_context(stage="hedge", page=page), span("hedge", page=page, profile=profile):
+        try:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            hedge_image = _prepare_input(image_path, work_dir / "input" / image_path.name, HEDGE_SCALE)
+            out_dir = work_dir / "output"
+            logger.info(f"Hedging straggler page {page} ({profile} profile, scale {HEDGE_SCALE})")
+            settings = MARKER_PROFILES[profile]
+            output_path = run_marker_for_chunk(
+                hedge_image,
+                output_dir=out_dir,
+                flags=settings["flags"],
+                config_overrides=settings["config"] or None,
+                skip_processors=settings.get("skip_processors"),
+                cancel=cancel,
+            )
+            markdown = output_path.read_text(encoding="utf-8")
+        except MarkerError:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        except Exception as e:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise MarkerError(f"Hedge run failed for page {page}: {e}")
+    page_dir = output_path.parent if output_path.parent.parent == out_dir else None
+    return HedgeResult(markdown, profile, HEDGE_SCALE, round(time.time() - start, 3), work_dir, page_dir)
+
+
+def record_document(pages: int):
+    """Update hedge rate and win rate gauges after a document's pages are done."""
+    metrics.inc("pages.hedge.eligible", pages)
+    launched = metrics.counter("pages.hedge.launched")
+    eligible = metrics.counter("pages.hedge.eligible")
+    if eligible:
+        metrics.set("pages.hedge_rate", round(launched / eligible, 4))
+    if launched:
+        metrics.set("pages.hedge_win_rate", round(metrics.counter("pages.hedge.won") / launched, 4))
@@ -0,0 +1,224 @@
+"""Compact per-document page store.
+
+Instead of one `<doc>_page_NNNN/` folder per page (markdown, `_meta.json` and images),
+Marker's per-page output can be packed into a single SQLite file per document:
+
+    OUTPUTS_DIR/<doc>/<doc>.pages.sqlite
+        pages(page, name, markdown, meta)
+        assets(page, name, data)
+
+Readers open the file read-only with SQLite memory-mapped I/O, so serving a page
+range or a single image touches only the pages involved. Enabled with PAGE_STORE=sqlite;
+the default "dirs" keeps the per-page folders.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import shutil
+import sqlite3
+import threading
+
+from ..core.config import PAGE_STORE, PAGE_STORE_MMAP_BYTES
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    markdown TEXT NOT NULL,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS assets (
+    page INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (page, name)
+);
+"""
+
+
+def page_store_path(doc_output_dir: Path, doc_name: str) -> Path:
+    return doc_output_dir / f"{doc_name}.pages.sqlite"
+
+
+def page_dir_name(doc_name: str, page: int) -> str:
+    """Name Marker gives the per-page output folder, e.g. `report_page_0003`."""
+    return f"{doc_name}_page_{page:04d}"
+
+
+class PageStore:
+    """SQLite container for one document's per-page Marker output.
+
+    Writers may be called from several worker threads; writes are serialized.
+    """
+
+    def __init__(self, path: Path, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        self._conn.execute(f"PRAGMA mmap_size={PAGE_STORE_MMAP_BYTES}")
+
+    @classmethod
+    def open_for_document(cls, doc_output_dir: Path, doc_name: str) -> Optional["PageStore"]:
+        """Open an existing store read-only, or return None if the document has none."""
+        path = page_store_path(doc_output_dir, doc_name)
+        if not path.exists():
+            return None
+        return cls(path, readonly=True)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put_page(self, page: int, name: str, markdown: str, meta: Optional[str] = None, assets: Dict[str, bytes] = None):
+        """Insert or replace one page together with its assets."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (page, name, markdown, meta) VALUES (?, ?, ?, ?)",
+                (page, name, markdown, meta),
+            )
+            self._conn.execute("DELETE FROM assets WHERE page = ?", (page,))
+            self._conn.executemany(
+                "INSERT INTO assets (page, name, data) VALUES (?, ?, ?)",
+                [(page, asset_name, sqlite3.Binary(data)) for asset_name, data in (assets or {}).items()],
+            )
+
+    def clear(self):
+        """Delete every page and asset in one transaction; open readers see old or empty, never a mix."""
+        with self._lock, self._conn:
+            removed = self._conn.execute("DELETE FROM pages").rowcount
+            self._conn.execute("DELETE FROM assets")
+        if removed:
+            logger.info(f"Cleared {removed} previous pages from {self.path.name}")
+
+    def ingest_page_dir(self, page: int, page_dir: Path, markdown: str) -> int:
+        """Move a Marker per-page output folder into the store and delete the folder.
+
+        Returns the number of bytes of files packed into the store.
+        """
+        meta = None
+        assets: Dict[str, bytes] = {}
+        packed = 0
+        for f in sorted(page_dir.rglob("*")):
+            if not f.is_file():
+                continue
+            packed += f.stat().st_size
+            if f.suffix == ".md":
+                continue  # markdown content is passed in already read
+            if f.name.endswith("_meta.json"):
+                meta = f.read_text(encoding="utf-8")
+            else:
+                assets[f.relative_to(page_dir).as_posix()] = f.read_bytes()
+        self.put_page(page, page_dir.name, markdown, meta, assets)
+        shutil.rmtree(page_dir, ignore_errors=True)
+        logger.debug(f"Packed {page_dir.name} into {self.path.name} ({len(assets)} assets, {packed} bytes)")
+        return packed
+
+    def page_numbers(self) -> List[int]:
+        return [row[0] for row in self._conn.execute("SELECT page FROM pages ORDER BY page")]
+
+    def iter_markdown(self, start: int = 1, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Yield (page, markdown) for pages in [start, end], in page order."""
+        end = end if end is not None else 2**31
+        cursor = self._conn.execute(
+            "SELECT page, markdown FROM pages WHERE page BETWEEN ? AND ? ORDER BY page", (start, end)
+        )
+        yield from cursor
+
+    def get_meta(self, page: int) -> Optional[str]:
+        row = self._conn.execute("SELECT meta FROM pages WHERE page = ?", (page,)).fetchone()
+        return row[0] if row else None
+
+    def get_asset(self, page: int, name: str) -> Optional[bytes]:
+        row = self._conn.execute(
+            "SELECT data FROM assets WHERE page = ? AND name = ?", (page, name)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+
+def _remove_previous_output(doc_output_dir: Path, doc_name: str):
+    """Delete per-page folders and any page store (which readers would prefer) of an earlier run."""
+    removed = 0
+    for page_dir in doc_output_dir.glob(f"{doc_name}_page_*"):
+        if page_dir.is_dir():
+            shutil.rmtree(page_dir, ignore_errors=True)
+            removed += 1
+    path = page_store_path(doc_output_dir, doc_name)
+    if path.exists():
+        for stale in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+            stale.unlink(missing_ok=True)
+        removed += 1
+    if removed:
+        logger.info(f"Removed previous page output of {doc_name} ({removed} entries)")
+
+
+def open_writer(doc_output_dir: Path, doc_name: str, fresh: bool = False) -> Optional[PageStore]:
+    """Return a writable store for the document when PAGE_STORE=sqlite, else None.
+
+    With `fresh` the pages of an earlier run (e.g. an earlier upload with the same name)
+    are deleted first, so none of them survive into the new run.
+    """
+    if PAGE_STORE != "sqlite":
+        if fresh:
+            _remove_previous_output(doc_output_dir, doc_name)
+        return None
+    store = PageStore(page_store_path(doc_output_dir, doc_name))
+    if fresh:
+        store.clear()
+    return store
+
+
+def iter_page_range(
+    doc_output_dir: Path,
+    doc_name: str,
+    start: int = 1,
+    end: Optional[int] = None,
+) -> Iterator[Tuple[int, str]]:
+    """Yield (page, markdown) for a page range from the store or, failing that, per-page folders.
+
+    Pages are read one at a time, so only the current page is held in memory.
+    """
+    store = PageStore.open_for_document(doc_output_dir, doc_name)
+    if store is not None:
+        with store:
+            yield from store.iter_markdown(start, end)
+        return
+
+    for page_dir in sorted(doc_output_dir.glob(f"{doc_name}_page_*")):
+        try:
+            page = int(page_dir.name.rsplit("_page_", 1)[-1])
+        except ValueError:
+            continue
+        if page < start or (end is not None and page > end) or not page_dir.is_dir():
+            continue
+        md_file = page_dir / f"{page_dir.name}.md"
+        if not md_file.exists():
+            md_files = list(page_dir.glob("*.md"))
+            if not md_files:
+                continue
+            md_file = md_files[0]
+        yield page, md_file.read_text(encoding="utf-8")
+
+
+def read_page_range(
+    doc_output_dir: Path,
+    doc_name: str,
+    start: int = 1,
+    end: Optional[int] = None,
+) -> List[Tuple[int, str]]:
+    """Return (page, markdown) for a page range from the store or, failing that, per-page folders."""
+    return list(iter_page_range(doc_output_dir, doc_name, start, end))
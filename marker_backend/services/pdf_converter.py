@@ -1,31 +1,70 @@
 """PDF to image conversion service.
 
-Converts PDF files to individual page images, processes each with marker_single,
-and combines extracted content into a single markdown output.
+Converts PDF files (and multi-frame or very tall images) to individual page images,
+processes each with marker_single, and combines extracted content into a single
+markdown output.
 """
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+import contextvars
+import json
 import tempfile
 import shutil
-from ..core.config import TEMP_DIR, OUTPUTS_DIR, PDF2IMAGE_DIR
-from ..core.logger import get_logger
-from ..core.exceptions import MarkerError
+import time
+import uuid
+from ..core.config import (
+    TEMP_DIR,
+    OUTPUTS_DIR,
+    PDF2IMAGE_DIR,
+    PAGE_ROUTING,
+    MARKER_PROFILES,
+    PREPROCESS_ENABLED,
+    PAGE_WORKERS,
+    PAGE_HANDOFF,
+    HANDOFF_DIR,
+    PAGE_HEDGING,
+    HEDGE_POLL_SEC,
+)
+from ..core.logger import get_logger, log_context, current_log_context
+from ..core.profiling import record_span, span, thread_profiler
+from ..core.exceptions import MarkerError, MarkerCancelled
+from ..core.metrics import metrics
+from .page_classifier import PageClass, classify_image, classify_page
+from .image_splitter import split_image
+from .active_jobs import active_jobs
+from .page_store import PageStore, open_writer
+from .image_preprocessor import preprocess_image, preprocess_pil, record_marker_cost
+from .page_handoff import handoff
+from .search_index import search_index
+from .job_journal import job_journal
+from .marker_runner import CancelToken
+from .cpu_planner import cpu_planner
+from .page_hedging import HedgeResult, StragglerDetector, record_document, run_hedge
 
 logger = get_logger(__name__)
 
 
-def _convert_pdf_to_images(pdf_path: Path, output_dir: Path) -> List[Path]:
+def _convert_pdf_to_images(
+    pdf_path: Path,
+    output_dir: Path,
+    classify: bool = False,
+) -> List[Tuple[Path, Optional[PageClass]]]:
     """Convert PDF to individual page images (PNG).
     
     Uses PyMuPDF (fitz) which is self-contained and doesn't require external system dependencies.
+    With PAGE_HANDOFF=shm the pixels are placed in shared memory instead and the PNG is
+    only written when Marker needs it (see services.page_handoff).
     
     Args:
         pdf_path: Path to input PDF file
         output_dir: Directory to save extracted images
+        classify: If True, classify each page (blank/text/table) while it is open
     
     Returns:
-        List of Path objects for generated image files (sorted by page number)
+        List of (image_path, page_class) tuples sorted by page number;
+        page_class is None when classify is False
     
     Raises:
         MarkerError: If conversion fails
@@ -47,7 +86,7 @@ def _convert_pdf_to_images(pdf_path: Path, output_dir: Path) -> List[Path]:
         page_count = doc.page_count
         logger.info(f"PDF has {page_count} pages")
         
-        image_paths = []
+        pages = []
         
         for page_num in range(page_count):
             # Get page and render to image (pixmap)
@@ -55,27 +94,40 @@ def _convert_pdf_to_images(pdf_path: Path, output_dir: Path) -> List[Path]:
             # Render at 2.0 zoom for 200 DPI equivalent quality
             pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
             
-            # Save page as PNG
+            # Save page as PNG (or hand the raw pixels over in shared memory)
             image_filename = output_dir / f"{pdf_path.stem}_page_{page_num + 1:04d}.png"
-            pix.save(str(image_filename))
-            image_paths.append(image_filename)
+            if PAGE_HANDOFF != "shm" or not handoff.offer(image_filename, pix):
+                pix.save(str(image_filename))
+            page_class = classify_page(page, pix) if classify else None
+            pages.append((image_filename, page_class))
             logger.debug(f"Saved page {page_num + 1} to {image_filename}")
         
         doc.close()
-        logger.info(f"Successfully converted {len(image_paths)} pages from PDF")
-        return image_paths
+        logger.info(f"Successfully converted {len(pages)} pages from PDF")
+        return pages
     
     except Exception as e:
         logger.error(f"PDF to image conversion failed: {e}")
         raise MarkerError(f"Failed to convert PDF to images: {str(e)}")
 
 
-def _process_image_with_marker(image_path: Path, output_dir: Path) -> str:
+def _process_image_with_marker(
+    image_path: Path,
+    output_dir: Path,
+    profile: str = "full",
+    page_store: Optional[PageStore] = None,
+    page_num: Optional[int] = None,
+    cancel: Optional[CancelToken] = None,
+) -> str:
     """Process single image with marker_single and return extracted markdown content.
     
     Args:
         image_path: Path to image file
         output_dir: Directory where marker should save outputs
+        profile: Name of the MARKER_PROFILES entry to run with
+        page_store: If given, Marker's per-page folder is packed into it and removed
+        page_num: Page number used as the key in page_store
+        cancel: Token to kill the Marker run (hedged pages)
     
     Returns:
         Extracted markdown content as string
@@ -86,8 +138,16 @@ def _process_image_with_marker(image_path: Path, output_dir: Path) -> str:
     from .marker_runner import run_marker_for_chunk
     
     try:
-        logger.info(f"Processing image with marker_single: {image_path}")
-        output_path = run_marker_for_chunk(image_path, output_dir=output_dir)
+        logger.info(f"Processing image with marker_single ({profile} profile): {image_path}")
+        settings = MARKER_PROFILES.get(profile) or MARKER_PROFILES["full"]
+        output_path = run_marker_for_chunk(
+            image_path,
+            output_dir=output_dir,
+            flags=settings["flags"],
+            config_overrides=settings["config"] or None,
+            skip_processors=settings.get("skip_processors"),
+            cancel=cancel,
+        )
         
         # Read the markdown output
         if not output_path.exists():
@@ -97,6 +157,15 @@ def _process_image_with_marker(image_path: Path, output_dir: Path) -> str:
             content = f.read()
         
         logger.debug(f"Extracted {len(content)} characters from {image_path}")
+
+        # Marker writes each page into its own folder directly under output_dir
+        page_dir = output_path.parent
+        if page_store is not None and page_num is not None and page_dir.parent == output_dir:
+            try:
+                page_store.ingest_page_dir(page_num, page_dir, content)
+            except Exception as e:
+                # The page folder stays on disk and remains readable; only packing failed
+                logger.warning(f"Failed to pack {page_dir} into page store: {e}")
         return content
     
     except MarkerError:
@@ -106,6 +175,91 @@ def _process_image_with_marker(image_path: Path, output_dir: Path) -> str:
         raise MarkerError(f"Failed to process image with marker: {str(e)}")
 
 
+def _process_page(
+    idx: int,
+    total: int,
+    image_path: Path,
+    page_class: Optional[PageClass],
+    doc_output_dir: Path,
+    page_store: Optional[PageStore] = None,
+    job_id: Optional[str] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Tuple[str, dict]:
+    """Run one page through its routed profile.
+
+    Returns (markdown_content, page_report). Marker failures become a placeholder
+    page instead of failing the whole document. With a job_id the page's start and
+    result are written to the job journal.
+
+    Raises:
+        MarkerCancelled: If the run was cancelled through `cancel` (a hedge won)
+    """
+    profile = page_class.profile if page_class else "full"
+    page_report = {"page": idx, "image": image_path.name, "profile": profile or "blank"}
+    if page_class:
+        page_report["classification"] = page_class.to_dict()
+    page_start = time.time()
+
+    with log_context(stage="marker", page=idx), thread_profiler(), span("page", page=idx, profile=profile or "blank"):
+        if profile is None:
+            logger.info(f"Skipping blank page {idx}/{total}: {image_path.name}")
+            handoff.release(image_path)
+            markdown_content = ""
+        else:
+            prep = None
+            if PREPROCESS_ENABLED:
+                with log_context(stage="preprocess", page=idx), span("preprocess", page=idx):
+                    try:
+                        shared = handoff.get(image_path)
+                        if shared is not None:
+                            # Work on the raw pixels; the only PNG encode is the preprocessed result
+                            prep = preprocess_pil(shared.to_image(), image_path)
+                            if prep is not None:
+                                handoff.release(image_path)
+                        else:
+                            prep = preprocess_image(image_path)
+                    except Exception as e:
+                        # A degenerate or undecodable image must not fail the document:
+                        # Marker gets the page as rendered
+                        logger.warning(f"Preprocessing failed for page {idx} ({image_path.name}), using original: {e}")
+                        metrics.inc("preprocess.failures")
+                        prep = None
+                if prep is not None:
+                    page_report["preprocess"] = prep.to_dict()
+            # Marker CLI reads from disk: write pixels still held in shared memory
+            handoff.materialize(image_path)
+            if job_id:
+                job_journal.page_started(job_id, idx)
+            logger.info(f"Processing image {idx}/{total} ({profile}): {image_path.name}")
+            try:
+                marker_start = time.time()
+                markdown_content = _process_image_with_marker(
+                    image_path,
+                    output_dir=doc_output_dir,
+                    profile=profile,
+                    page_store=page_store,
+                    page_num=idx,
+                    cancel=cancel,
+                )
+                if prep is not None:
+                    record_marker_cost(prep.pixels_after, time.time() - marker_start)
+                # Searchable as soon as the page is done, before the document finishes
+                search_index.index_page(doc_output_dir.name, idx, markdown_content)
+            except MarkerCancelled:
+                logger.info(f"Cancelled page {idx}/{total}: a hedged run finished first")
+                raise
+            except MarkerError as e:
+                logger.warning(f"Failed to process image {image_path}: {e}")
+                page_report["error"] = str(e)
+                # Continue with remaining images instead of failing completely
+                markdown_content = f"*Failed to extract content from this page: {str(e)}*\n"
+
+    page_report["seconds"] = round(time.time() - page_start, 3)
+    if job_id:
+        job_journal.page_finished(job_id, idx, markdown_content, page_report)
+    return markdown_content, page_report
+
+
 def _combine_markdown_content(
     contents: List[Tuple[Path, str]],
     original_filename: str
@@ -157,6 +311,28 @@ def _save_combined_markdown(content: str, output_path: Path) -> Path:
         raise MarkerError(f"Failed to save combined markdown: {str(e)}")
 
 
+def _summarize_profiles(page_reports: List[dict]) -> Dict[str, dict]:
+    """Aggregate per-page timings into per-profile totals for the job report."""
+    summary: Dict[str, dict] = {}
+    for entry in page_reports:
+        stats = summary.setdefault(entry["profile"], {"pages": 0, "total_seconds": 0.0})
+        stats["pages"] += 1
+        stats["total_seconds"] += entry["seconds"]
+    for stats in summary.values():
+        stats["total_seconds"] = round(stats["total_seconds"], 3)
+        stats["mean_seconds"] = round(stats["total_seconds"] / stats["pages"], 3)
+    return summary
+
+
+def _save_job_report(report: dict, output_path: Path):
+    """Write the job report JSON next to the combined markdown. Failures are only logged."""
+    try:
+        output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        logger.info(f"Saved job report to {output_path}")
+    except Exception as e:
+        logger.warning(f"Failed to save job report {output_path}: {e}")
+
+
 def _cleanup_temp_images(image_paths: List[Path], keep_images: bool = False):
     """Clean up temporary image files after processing.
     
@@ -176,6 +352,429 @@ def _cleanup_temp_images(image_paths: List[Path], keep_images: bool = False):
         except Exception as e:
             logger.warning(f"Failed to delete temporary image {image_path}: {e}")
 
+    # Remove the now empty per-document image folders as well
+    for image_dir in {image_path.parent for image_path in image_paths}:
+        try:
+            image_dir.rmdir()
+            logger.debug(f"Deleted temporary image directory: {image_dir}")
+        except OSError:
+            pass  # not empty (e.g. other files) or already gone
+
+
+def _process_queued_page(submitted: float, started: Dict[int, float], idx: int, *args) -> Tuple[str, dict]:
+    """Run `_process_page` in a worker, recording how long the page waited and when it started."""
+    record_span("queue", submitted, time.perf_counter(), page=idx)
+    started[idx] = time.time()
+    return _process_page(idx, *args)
+
+
+def _adopt_hedge(
+    idx: int,
+    image_path: Path,
+    hedge: HedgeResult,
+    started_at: float,
+    doc_output_dir: Path,
+    page_store: Optional[PageStore],
+    job_id: Optional[str],
+) -> Tuple[str, dict]:
+    """Use a hedge run's output for page `idx`, in place of the cancelled original run."""
+    if hedge.page_dir is not None:
+        target = doc_output_dir / hedge.page_dir.name
+        # The cancelled run may have left a partial page folder behind
+        shutil.rmtree(target, ignore_errors=True)
+        try:
+            if page_store is not None:
+                page_store.ingest_page_dir(idx, hedge.page_dir, hedge.markdown)
+            else:
+                shutil.move(str(hedge.page_dir), str(target))
+        except Exception as e:
+            logger.warning(f"Failed to keep hedge output folder for page {idx}: {e}")
+    hedge.discard()
+
+    page_report = {
+        "page": idx,
+        "image": image_path.name,
+        "profile": hedge.profile,
+        "hedge": {"scale": hedge.scale, "seconds": hedge.seconds},
+        "seconds": round(time.time() - started_at, 3),
+    }
+    search_index.index_page(doc_output_dir.name, idx, hedge.markdown)
+    if job_id:
+        job_journal.page_finished(job_id, idx, hedge.markdown, page_report)
+    return hedge.markdown, page_report
+
+
+def _run_pages_parallel(
+    todo: List[Tuple[int, Path, Optional[PageClass]]],
+    total: int,
+    workers: int,
+    doc_output_dir: Path,
+    page_store: Optional[PageStore],
+    job_id: Optional[str],
+) -> Dict[int, Tuple[str, dict]]:
+    """Process pages on a thread pool, hedging stragglers once every page has started.
+
+    A page running longer than the document's running p95 page time is run again on
+    an idle worker (see services.page_hedging). The first run to finish is used; the
+    other is cancelled, which kills its Marker process.
+    """
+    results: Dict[int, Tuple[str, dict]] = {}
+    pages = {idx: (image_path, page_class) for idx, image_path, page_class in todo}
+    started: Dict[int, float] = {}
+    tokens = {idx: CancelToken() for idx in pages}
+    primaries: Dict[Future, int] = {}
+    hedges: Dict[Future, int] = {}
+    hedge_of: Dict[int, Future] = {}
+    hedge_tokens: Dict[int, CancelToken] = {}
+    # Failed original runs kept while their hedge is still running
+    failed: Dict[int, Tuple[str, dict]] = {}
+    detector = StragglerDetector()
+
+    def resolve(idx: int, result: Tuple[str, dict]):
+        """Use the original run's result for page `idx` and stop its hedge, if any."""
+        results[idx] = result
+        started_at = tokens[idx].started_at
+        if started_at is not None and not result[1].get("error"):
+            # Time from Marker launch, like the straggler check below (excludes CPU slot waits)
+            detector.add(time.time() - started_at)
+        hedge = hedge_of.get(idx)
+        if hedge is not None and (not hedge.done() or hedge.exception() is None):
+            hedge_tokens[idx].cancel()
+            metrics.inc("pages.hedge.lost")
+
+    logger.info(f"Processing {len(todo)} pages with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page") as pool:
+        # Each task runs in a copy of the caller's context so job/log context carries over
+        for idx, (image_path, page_class) in pages.items():
+            future = pool.submit(
+                contextvars.copy_context().run,
+                _process_queued_page, time.perf_counter(), started,
+                idx, total, image_path, page_class, doc_output_dir, page_store, job_id, tokens[idx],
+            )
+            primaries[future] = idx
+        pending = set(primaries)
+
+        while pending:
+            done, pending = wait(pending, timeout=HEDGE_POLL_SEC if PAGE_HEDGING else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in primaries:
+                    idx = primaries[future]
+                    if idx in results:
+                        continue  # hedge was adopted; this run was cancelled
+                    try:
+                        result = future.result()
+                    except MarkerCancelled:
+                        continue  # handled when the hedge finished
+                    hedge = hedge_of.get(idx)
+                    if result[1].get("error") and hedge is not None and not hedge.done():
+                        failed[idx] = result  # give the hedge a chance
+                    else:
+                        resolve(idx, result)
+                else:
+                    idx = hedges[future]
+                    if idx in results:
+                        hedge_result = None
+                        try:
+                            hedge_result = future.result()
+                        except MarkerError:
+                            pass
+                        if hedge_result is not None:
+                            hedge_result.discard()
+                        continue
+                    try:
+                        hedge_result = future.result()
+                    except MarkerError as e:
+                        if not isinstance(e, MarkerCancelled):
+                            metrics.inc("pages.hedge.failed")
+                            logger.warning(f"Hedge run for page {idx} failed: {e}")
+                        if idx in failed:
+                            resolve(idx, failed.pop(idx))
+                        continue
+                    # Hedge finished first: stop the original run and take the hedge's output
+                    tokens[idx].cancel()
+                    primary = next(f for f, i in primaries.items() if i == idx)
+                    try:
+                        result = failed.pop(idx, None) or primary.result()
+                    except MarkerCancelled:
+                        result = None
+                    pending.discard(primary)
+                    if result is not None and not result[1].get("error"):
+                        # The original run completed while the hedge was finishing
+                        hedge_result.discard()
+                        resolve(idx, result)
+                        continue
+                    metrics.inc("pages.hedge.won")
+                    logger.info(f"Hedged run won for page {idx}")
+                    results[idx] = _adopt_hedge(
+                        idx, pages[idx][0], hedge_result, started[idx], doc_output_dir, page_store, job_id
+                    )
+
+            if not PAGE_HEDGING or len(started) < len(pages):
+                continue
+            threshold = detector.threshold()
+            if threshold is None:
+                continue
+            running = sum(1 for f in pending if not f.done())
+            idle = workers - running
+            now = time.time()
+            # Pages still waiting for a CPU slot have not started and are not stragglers
+            stragglers = sorted(
+                (
+                    idx for idx in pages
+                    if idx not in results and idx not in hedge_of and tokens[idx].started.is_set()
+                    and now - tokens[idx].started_at > threshold
+                ),
+                key=lambda i: tokens[i].started_at,
+            )
+            for idx in stragglers[:max(0, idle)]:
+                image_path, page_class = pages[idx]
+                if not image_path.exists():
+                    continue
+                logger.info(
+                    f"Page {idx} running {now - tokens[idx].started_at:.1f}s > straggler threshold {threshold:.1f}s"
+                )
+                hedge_tokens[idx] = CancelToken()
+                future = pool.submit(
+                    contextvars.copy_context().run,
+                    run_hedge, idx, image_path, (page_class.profile if page_class else None) or "full",
+                    doc_output_dir, hedge_tokens[idx],
+                )
+                hedges[future] = idx
+                hedge_of[idx] = future
+                pending.add(future)
+
+    record_document(len(todo))
+    return results
+
+
+def _run_pages(
+    pages: List[Tuple[Path, Optional[PageClass]]],
+    doc_output_dir: Path,
+    page_store: Optional[PageStore] = None,
+    job_id: Optional[str] = None,
+    completed: Optional[Dict[int, Tuple[str, dict]]] = None,
+) -> List[Tuple[str, dict]]:
+    """Run every page through `_process_page`, PAGE_WORKERS at a time (at most the CPU plan's
+    worker count on CPU-only hosts), keeping page order.
+
+    Pages in `completed` (finished by an earlier run of a resumed job) are not processed again.
+    """
+    total = len(pages)
+    completed = completed or {}
+    todo = [
+        (idx, image_path, page_class)
+        for idx, (image_path, page_class) in enumerate(pages, 1)
+        if idx not in completed
+    ]
+    for idx, (image_path, _) in enumerate(pages, 1):
+        if idx in completed:
+            handoff.release(image_path)
+    if completed:
+        logger.info(f"Reusing {len(completed)} finished pages, {len(todo)} pages left to process")
+
+    results: Dict[int, Tuple[str, dict]] = dict(completed)
+    workers = min(cpu_planner.page_workers(PAGE_WORKERS), len(todo))
+    if workers <= 1:
+        for idx, image_path, page_class in todo:
+            results[idx] = _process_page(idx, total, image_path, page_class, doc_output_dir, page_store, job_id)
+    else:
+        results.update(_run_pages_parallel(todo, total, workers, doc_output_dir, page_store, job_id))
+    return [results[idx] for idx in range(1, total + 1)]
+
+
+def _process_pages(
+    pages: List[Tuple[Path, Optional[PageClass]]],
+    doc_name: str,
+    original_filename: str,
+    doc_output_dir: Path,
+    job_id: Optional[str] = None,
+    completed: Optional[Dict[int, Tuple[str, dict]]] = None,
+) -> Path:
+    """Process page images with Marker, combine them and save markdown plus job report.
+
+    Shared by PDFs, multi-frame images and tiled tall images.
+    """
+    logger.info("Processing extracted images with marker_single")
+
+    # Ensure document output directory exists before processing
+    doc_output_dir.mkdir(parents=True, exist_ok=True)
+    if not completed:
+        # A re-upload may have fewer pages than the previous run; start its index afresh
+        search_index.remove_document(doc_output_dir.name)
+    # Resumed jobs keep the pages already stored; fresh ones must not inherit stale pages
+    page_store = open_writer(doc_output_dir, doc_name, fresh=not completed)
+    try:
+        results = _run_pages(pages, doc_output_dir, page_store, job_id, completed)
+    finally:
+        if page_store is not None:
+            page_store.close()
+
+    contents: List[Tuple[Path, str]] = [
+        (image_path, markdown_content) for (image_path, _), (markdown_content, _) in zip(pages, results)
+    ]
+    page_reports: List[dict] = [page_report for _, page_report in results]
+
+    with log_context(stage="combine"), span("combine"):
+        # Combine all extracted content
+        logger.info(f"Combining content from {len(contents)} processed images")
+        combined_content = _combine_markdown_content(contents, original_filename)
+
+        # Save combined markdown inside document folder
+        output_path = doc_output_dir / f"{doc_name}.md"
+        final_path = _save_combined_markdown(combined_content, output_path)
+        _save_job_report(
+            {
+                "document": original_filename,
+                "pages": page_reports,
+                "profiles": _summarize_profiles(page_reports),
+            },
+            doc_output_dir / f"{doc_name}_report.json",
+        )
+    return final_path
+
+
+def _load_pages(
+    job_id: str,
+    extract_pages: Callable[[Path], List[Tuple[Path, Optional[PageClass]]]],
+    temp_image_dir: Path,
+    resume: bool,
+) -> Tuple[List[Tuple[Path, Optional[PageClass]]], Dict[int, Tuple[str, dict]]]:
+    """Return (pages, completed) for a job, rendering only when journaled images are not usable.
+
+    A resumed job reuses the page list and finished pages from the journal. Its page
+    images are rendered again only if a pending page's image is gone (e.g. it was
+    still in shared memory when the process stopped).
+    """
+    journaled = job_journal.pages(job_id) if resume else []
+    completed = job_journal.completed_pages(job_id) if resume else {}
+    if journaled and all(p["image"].exists() for p in journaled if p["page"] not in completed):
+        pages = [
+            (p["image"], PageClass(**p["page_class"]) if p["page_class"] else None)
+            for p in journaled
+        ]
+        logger.info(f"Resuming from journal with {len(pages)} pages")
+        return pages, completed
+
+    with log_context(stage="render"), span("render"):
+        pages = extract_pages(temp_image_dir)
+    job_journal.record_pages(
+        job_id,
+        [
+            (idx, image_path, page_class.to_dict() if page_class else None)
+            for idx, (image_path, page_class) in enumerate(pages, 1)
+        ],
+    )
+    return pages, completed
+
+
+def _run_document_workflow(
+    source_path: Path,
+    extract_pages: Callable[[Path], List[Tuple[Path, Optional[PageClass]]]],
+    output_dir: Path,
+    keep_images: bool,
+    temp_image_subdir: Optional[str],
+    kind: str,
+    image_base_dir: Path = PDF2IMAGE_DIR,
+    job_id: Optional[str] = None,
+    resume: bool = False,
+) -> Path:
+    """Extract page images from `source_path`, process them and clean up.
+
+    Args:
+        source_path: Uploaded document (PDF or image)
+        extract_pages: Writes page images into the given directory and returns (path, class) pairs
+        output_dir: Directory for the document folder
+        keep_images: If True, preserve extracted images in PDF2IMAGE_DIR
+        temp_image_subdir: Subdirectory in PDF2IMAGE_DIR (defaults to "{stem}_images")
+        kind: Label for log messages ("PDF", "image")
+        image_base_dir: Parent of the page image folder (PDF2IMAGE_DIR, or HANDOFF_DIR for shm handoff)
+        job_id: Journal id of the job (defaults to the request's job_id, or a new id)
+        resume: Continue a journaled job, reusing its finished pages
+    """
+    if output_dir is None:
+        output_dir = OUTPUTS_DIR
+
+    if temp_image_subdir is None:
+        temp_image_subdir = f"{source_path.stem}_images"
+
+    job_id = job_id or current_log_context().get("job_id") or uuid.uuid4().hex[:12]
+    job_journal.start_job(
+        job_id,
+        kind,
+        source_path,
+        {
+            "output_dir": str(output_dir),
+            "keep_images": keep_images,
+            "temp_image_subdir": temp_image_subdir,
+            "image_base_dir": str(image_base_dir),
+        },
+    )
+
+    # Images stored in PDF2IMAGE_DIR (or tmpfs for shm handoff) instead of TEMP_DIR
+    temp_image_dir = image_base_dir / temp_image_subdir
+    # Document-specific output folder
+    doc_output_dir = output_dir / source_path.stem
+    image_paths = []  # Initialize to prevent UnboundLocalError in except block
+    # Protect this job's files from the temp janitor until the workflow ends
+    job_paths = (source_path, temp_image_dir, doc_output_dir)
+    active_jobs.acquire(*job_paths)
+
+    try:
+        with log_context(job_id=job_id):
+            # Step 1: Extract page images (or pick them up from the journal)
+            logger.info(f"Starting {kind} conversion workflow for {source_path}")
+            pages, completed = _load_pages(job_id, extract_pages, temp_image_dir, resume)
+            image_paths = [image_path for image_path, _ in pages]
+
+            if not image_paths:
+                raise MarkerError(f"No images extracted from {kind} {source_path}")
+
+            logger.info(f"Extracted {len(image_paths)} images from {kind}")
+
+            # Steps 2-4: Process pages, combine and save
+            final_path = _process_pages(
+                pages, source_path.stem, source_path.name, doc_output_dir, job_id, completed
+            )
+
+            # Step 5: Cleanup temporary images (if not keeping)
+            _cleanup_temp_images(image_paths, keep_images=keep_images)
+
+            job_journal.finish_job(job_id, "done", str(final_path))
+            logger.info(f"{kind} conversion workflow completed successfully. Output: {final_path}")
+            return final_path
+
+    except MarkerError as e:
+        # Cleanup on error (including pages rendered before a conversion failure)
+        job_journal.finish_job(job_id, "failed", str(e))
+        _cleanup_temp_images(image_paths, keep_images=keep_images)
+        if not keep_images:
+            shutil.rmtree(temp_image_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        # Cleanup on unexpected error
+        logger.error(f"Unexpected error in {kind} conversion workflow: {e}")
+        job_journal.finish_job(job_id, "failed", str(e))
+        _cleanup_temp_images(image_paths, keep_images=False)
+        shutil.rmtree(temp_image_dir, ignore_errors=True)
+        raise MarkerError(f"{kind} conversion workflow failed: {str(e)}")
+    finally:
+        # Never leak shared memory of pages that were not processed
+        for image_path in image_paths:
+            handoff.release(image_path)
+        active_jobs.release(*job_paths)
+
+
+def _pdf_page_extractor(pdf_path: Path) -> Callable[[Path], List[Tuple[Path, Optional[PageClass]]]]:
+    return lambda image_dir: _convert_pdf_to_images(pdf_path, image_dir, classify=PAGE_ROUTING)
+
+
+def _image_page_extractor(image_path: Path) -> Callable[[Path], List[Tuple[Path, Optional[PageClass]]]]:
+    def extract_pages(image_dir: Path) -> List[Tuple[Path, Optional[PageClass]]]:
+        page_paths = split_image(image_path, image_dir)
+        return [(p, classify_image(p) if PAGE_ROUTING else None) for p in page_paths]
+
+    return extract_pages
+
 
 def convert_pdf_and_process(
     pdf_path: Path,
@@ -188,11 +787,14 @@ def convert_pdf_and_process(
     Outputs are organized hierarchically:
     - OUTPUTS_DIR/{pdf_filename}/
         - {pdf_filename}.md (combined markdown)
+        - {pdf_filename}_report.json (per-page profile and timing)
         - {pdf_filename}_page_0001/
             - {pdf_filename}_page_0001.md
             - {pdf_filename}_page_0001_meta.json
         - {pdf_filename}_page_0002/
             - ...
+        With PAGE_STORE=sqlite the per-page folders are packed into
+        {pdf_filename}.pages.sqlite instead (see services.page_store).
     
     Args:
         pdf_path: Path to input PDF file
@@ -207,65 +809,62 @@ def convert_pdf_and_process(
     Raises:
         MarkerError: If any step in the workflow fails
     """
-    if output_dir is None:
-        output_dir = OUTPUTS_DIR
-    
-    if temp_image_subdir is None:
-        temp_image_subdir = f"{pdf_path.stem}_images"
-    
-    # Images stored in PDF2IMAGE_DIR instead of TEMP_DIR
-    temp_image_dir = PDF2IMAGE_DIR / temp_image_subdir
-    # Document-specific output folder
-    doc_output_dir = output_dir / pdf_path.stem
-    image_paths = []  # Initialize to prevent UnboundLocalError in except block
-    
-    try:
-        # Step 1: Convert PDF to images
-        logger.info(f"Starting PDF conversion workflow for {pdf_path}")
-        image_paths = _convert_pdf_to_images(pdf_path, temp_image_dir)
-        
-        if not image_paths:
-            raise MarkerError(f"No images extracted from PDF {pdf_path}")
-        
-        logger.info(f"Extracted {len(image_paths)} images from PDF")
-        
-        # Step 2: Process each image with marker_single (sequentially)
-        logger.info("Processing extracted images with marker_single")
-        contents: List[Tuple[Path, str]] = []
-        
-        # Ensure document output directory exists before processing
-        doc_output_dir.mkdir(parents=True, exist_ok=True)
-        
-        for idx, image_path in enumerate(image_paths, 1):
-            logger.info(f"Processing image {idx}/{len(image_paths)}: {image_path.name}")
-            try:
-                markdown_content = _process_image_with_marker(image_path, output_dir=doc_output_dir)
-                contents.append((image_path, markdown_content))
-            except MarkerError as e:
-                logger.warning(f"Failed to process image {image_path}: {e}")
-                # Continue with remaining images instead of failing completely
-                contents.append((image_path, f"*Failed to extract content from this page: {str(e)}*\n"))
-        
-        # Step 3: Combine all extracted content
-        logger.info(f"Combining content from {len(contents)} processed images")
-        combined_content = _combine_markdown_content(contents, pdf_path.name)
-        
-        # Step 4: Save combined markdown inside document folder
-        output_path = doc_output_dir / f"{pdf_path.stem}.md"
-        final_path = _save_combined_markdown(combined_content, output_path)
-        
-        # Step 5: Cleanup temporary images (if not keeping)
-        _cleanup_temp_images(image_paths, keep_images=keep_images)
-        
-        logger.info(f"PDF conversion workflow completed successfully. Output: {final_path}")
-        return final_path
-    
-    except MarkerError:
-        # Cleanup on error
-        _cleanup_temp_images(image_paths, keep_images=keep_images)
-        raise
-    except Exception as e:
-        # Cleanup on unexpected error
-        logger.error(f"Unexpected error in PDF conversion workflow: {e}")
-        _cleanup_temp_images(image_paths, keep_images=False)
-        raise MarkerError(f"PDF conversion workflow failed: {str(e)}")
+    return _run_document_workflow(
+        pdf_path,
+        _pdf_page_extractor(pdf_path),
+        output_dir,
+        keep_images,
+        temp_image_subdir,
+        kind="PDF",
+        image_base_dir=HANDOFF_DIR if PAGE_HANDOFF == "shm" else PDF2IMAGE_DIR,
+    )
+
+
+def convert_image_and_process(
+    image_path: Path,
+    output_dir: Path = None,
+    keep_images: bool = False,
+    temp_image_subdir: str = None
+) -> Path:
+    """Split a multi-frame or very tall image into pages and process them like a PDF.
+
+    Output layout is the same as `convert_pdf_and_process`, one "page" per frame/tile.
+
+    Raises:
+        MarkerError: If any step in the workflow fails
+    """
+    return _run_document_workflow(
+        image_path,
+        _image_page_extractor(image_path),
+        output_dir,
+        keep_images,
+        temp_image_subdir,
+        kind="image",
+    )
+
+
+def resume_job(job: dict) -> Path:
+    """Continue a job left unfinished by a previous process (an entry of `job_journal.unfinished_jobs`).
+
+    Pages the journal records as finished are reused; the rest are processed and
+    the document is combined as usual.
+
+    Raises:
+        MarkerError: If the source file is gone or the workflow fails
+    """
+    source_path: Path = job["source_path"]
+    params = job["params"]
+    if not source_path.exists():
+        raise MarkerError(f"Source file for job {job['job_id']} no longer exists: {source_path}")
+    extractor = _pdf_page_extractor if job["kind"] == "PDF" else _image_page_extractor
+    return _run_document_workflow(
+        source_path,
+        extractor(source_path),
+        Path(params["output_dir"]),
+        params["keep_images"],
+        params["temp_image_subdir"],
+        kind=job["kind"],
+        image_base_dir=Path(params["image_base_dir"]),
+        job_id=job["job_id"],
+        resume=True,
+    )
@@ -0,0 +1,229 @@
+"""Full-text search over converted documents (SQLite FTS5).
+
+The index lives in SEARCH_INDEX_PATH and is updated incrementally: each page is
+indexed as soon as Marker finishes it, and documents are dropped when the janitor
+removes their output folder. Two FTS5 tables are kept:
+
+- pages(document, page, content): page markdown, for document/page/snippet hits
+- table_cells(document, page, table_idx, row_idx, col_idx, header, value):
+  one row per cell of every markdown table, for table-cell search
+
+FTS5 cannot index its UNINDEXED columns, so deleting by document/page there scans
+the whole table. The regular `page_rows` table maps (document, page) to the FTS
+rowids of the page and its cells; re-indexing a page or dropping a document looks
+them up there and deletes by rowid.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+import re
+import sqlite3
+import threading
+import time
+
+from ..core.config import SEARCH_INDEX_PATH, SEARCH_ENABLED
+from ..core.logger import get_logger
+from ..core.metrics import metrics
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+    document UNINDEXED, page UNINDEXED, content, tokenize = 'unicode61'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS table_cells USING fts5(
+    document UNINDEXED, page UNINDEXED, table_idx UNINDEXED, row_idx UNINDEXED,
+    col_idx UNINDEXED, header, value, tokenize = 'unicode61'
+);
+CREATE TABLE IF NOT EXISTS page_rows (
+    document TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    fts_table TEXT NOT NULL,
+    fts_rowid INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS page_rows_document_page ON page_rows (document, page);
+"""
+
+# FTS tables whose rows are tracked in page_rows
+FTS_TABLES = ("pages", "table_cells")
+
+TABLE_ROW_REGEX = re.compile(r"^\s*\|.*\|\s*$")
+SEPARATOR_LINE_REGEX = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+
+def _split_row(line: str) -> List[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def iter_table_cells(markdown: str) -> Iterator[Tuple[int, int, int, str, str]]:
+    """Yield (table_idx, row_idx, col_idx, header, value) for each cell of each markdown table."""
+    table_idx = -1
+    header: Optional[List[str]] = None
+    row_idx = 0
+    for line in markdown.splitlines():
+        if not TABLE_ROW_REGEX.match(line):
+            header = None
+            continue
+        if SEPARATOR_LINE_REGEX.match(line):
+            continue
+        cells = _split_row(line)
+        if header is None:
+            table_idx += 1
+            header = cells
+            row_idx = 0
+            continue
+        row_idx += 1
+        for col_idx, value in enumerate(cells):
+            if value:
+                col_header = header[col_idx] if col_idx < len(header) else ""
+                yield table_idx, row_idx, col_idx, col_header, value
+
+
+def _to_match_query(query: str) -> str:
+    """Quote each term so user input never hits FTS5 query syntax errors."""
+    terms = [t.replace('"', '""') for t in query.split() if t.strip()]
+    return " ".join(f'"{t}"' for t in terms)
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.available = SEARCH_ENABLED
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self.available:
+            return None
+        if self._conn is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                mapped = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'page_rows'").fetchone()
+                conn.executescript(SCHEMA)
+                if not mapped:
+                    # Index created before page_rows existed: map its rows once
+                    with conn:
+                        for table in FTS_TABLES:
+                            conn.execute(
+                                "INSERT INTO page_rows (document, page, fts_table, fts_rowid) "
+                                f"SELECT document, page, '{table}', rowid FROM {table}"
+                            )
+                self._conn = conn
+            except sqlite3.Error as e:
+                # Most likely SQLite built without FTS5
+                logger.warning(f"Search index disabled: {e}")
+                self.available = False
+                return None
+        return self._conn
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, where: str, params: tuple):
+        """Delete the FTS rows mapped in page_rows matching `where` (by rowid) and their mapping."""
+        for table in FTS_TABLES:
+            conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN "
+                f"(SELECT fts_rowid FROM page_rows WHERE fts_table = ? AND {where})",
+                (table, *params),
+            )
+        conn.execute(f"DELETE FROM page_rows WHERE {where}", params)
+
+    def index_page(self, document: str, page: int, markdown: str):
+        """(Re)index one page of a document, including its table cells."""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            start = time.perf_counter()
+            try:
+                with conn:
+                    self._delete_rows(conn, "document = ? AND page = ?", (document, page))
+                    rows = [(
+                        "pages",
+                        conn.execute(
+                            "INSERT INTO pages (document, page, content) VALUES (?, ?, ?)",
+                            (document, page, markdown),
+                        ).lastrowid,
+                    )]
+                    for cell in iter_table_cells(markdown):
+                        cur = conn.execute(
+                            "INSERT INTO table_cells (document, page, table_idx, row_idx, col_idx, header, value) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (document, page, *cell),
+                        )
+                        rows.append(("table_cells", cur.lastrowid))
+                    conn.executemany(
+                        "INSERT INTO page_rows (document, page, fts_table, fts_rowid) VALUES (?, ?, ?, ?)",
+                        [(document, page, table, rowid) for table, rowid in rows],
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to index {document} page {page}: {e}")
+                return
+        metrics.observe("search.index_seconds", time.perf_counter() - start)
+        metrics.inc("search.indexed_pages")
+
+    def remove_document(self, document: str):
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    self._delete_rows(conn, "document = ?", (document,))
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to remove {document} from search index: {e}")
+
+    def search(self, query: str, limit: int = 20, document: Optional[str] = None) -> List[dict]:
+        """Return page hits ordered by relevance: document, page, snippet, score."""
+        sql = (
+            "SELECT document, page, snippet(pages, 2, '[', ']', '...', 16), bm25(pages) "
+            "FROM pages WHERE pages MATCH ?"
+        )
+        rows = self._query(sql, query, limit, document)
+        return [
+            {"document": d, "page": int(p), "snippet": snip, "score": round(-score, 4)}
+            for d, p, snip, score in rows
+        ]
+
+    def search_tables(self, query: str, limit: int = 20, document: Optional[str] = None) -> List[dict]:
+        """Return table cell hits: document, page, table, row, column, header, value."""
+        sql = (
+            "SELECT document, page, table_idx, row_idx, col_idx, header, value, bm25(table_cells) "
+            "FROM table_cells WHERE table_cells MATCH ?"
+        )
+        rows = self._query(sql, query, limit, document)
+        return [
+            {
+                "document": d,
+                "page": int(p),
+                "table": int(t) + 1,
+                "row": int(r),
+                "column": int(c) + 1,
+                "header": h,
+                "value": v,
+                "score": round(-score, 4),
+            }
+            for d, p, t, r, c, h, v, score in rows
+        ]
+
+    def _query(self, sql: str, query: str, limit: int, document: Optional[str]) -> list:
+        match = _to_match_query(query)
+        if not match:
+            return []
+        params: list = [match]
+        if document:
+            sql += " AND document = ?"
+            params.append(document)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        start = time.perf_counter()
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return []
+            rows = conn.execute(sql, params).fetchall()
+        metrics.observe("search.query_seconds", time.perf_counter() - start)
+        return rows
+
+
+search_index = SearchIndex()
@@ -1,11 +1,16 @@
 import re
-import math
+import itertools
+import mmap
 from pathlib import Path
 from io import StringIO
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 import pandas as pd
+from openpyxl import Workbook
 
 from ..core.logger import get_logger
+from ..core.metrics import metrics
+from ..core.profiling import span
+from .page_store import page_store_path, iter_page_range
 
 logger = get_logger(__name__)
 
@@ -13,38 +18,133 @@ TABLE_REGEX = re.compile(r"(\|.*\|\s*\n)+", re.MULTILINE)
 SEPARATOR_LINE_REGEX = re.compile(r'^\s*\|?\s*:?-{3,}', re.IGNORECASE)
 
 
+def _parse_table(table_md: str) -> Optional[pd.DataFrame]:
+    """Parse one markdown table into a DataFrame, or None if it is empty or malformed."""
+    cleaned_table = "\n".join(
+        line for line in table_md.splitlines()
+        if not SEPARATOR_LINE_REGEX.match(line)
+    ).strip()
+    if not cleaned_table:
+        return None
+    try:
+        df = pd.read_csv(StringIO(cleaned_table), sep="|", engine="python")
+        df = df.dropna(axis=1, how="all")
+        df.columns = df.columns.str.strip()
+        return df.map(lambda x: x.strip() if isinstance(x, str) else x)
+    except Exception as e:  # noqa: BLE001
+        logger.warning(f"Failed to parse a table chunk: {e}")
+        return None
+
+
+def iter_tables_from_markdown(content: str) -> Iterator[pd.DataFrame]:
+    """Yield the tables of a markdown string one at a time. Tables that fail to parse are skipped."""
+    for match in TABLE_REGEX.finditer(content):
+        df = _parse_table(match.group(0))
+        if df is not None:
+            yield df
+
+
+def _iter_table_blocks(md_file_path: Path) -> Iterator[str]:
+    """Yield text regions of a markdown file that may contain tables.
+
+    The file is scanned line by line through a memory map; only the current run of
+    pipe/blank lines is decoded and held in memory, never the whole file.
+    """
+    with md_file_path.open("rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            block: List[bytes] = []
+            has_pipe = False
+            for line in iter(mm.readline, b""):
+                if b"|" in line:
+                    block.append(line)
+                    has_pipe = True
+                elif not line.strip() and block:
+                    # Blank lines inside a table run are kept, as TABLE_REGEX allows them
+                    block.append(line)
+                elif block:
+                    if has_pipe:
+                        yield b"".join(block).decode("utf-8", errors="replace")
+                    block, has_pipe = [], False
+            if has_pipe:
+                yield b"".join(block).decode("utf-8", errors="replace")
+
+
+def iter_tables(md_file_path: Path) -> Iterator[pd.DataFrame]:
+    """Yield the tables of a markdown file one at a time, with memory bounded by the largest table."""
+    if not md_file_path.exists():
+        raise FileNotFoundError(f"Markdown file not found: {md_file_path}")
+    for block in _iter_table_blocks(md_file_path):
+        yield from iter_tables_from_markdown(block)
+
+
 def extract_tables_as_dataframes(md_file_path: Path) -> List[pd.DataFrame]:
     """Extract markdown tables from a file and convert them into DataFrames.
 
     Returns a list of DataFrames. Any table that fails to parse is skipped.
+    Prefer `iter_tables` for large files.
     """
-    if not md_file_path.exists():
-        raise FileNotFoundError(f"Markdown file not found: {md_file_path}")
-
-    content = md_file_path.read_text(encoding="utf-8")
-    tables_md = [m.group(0) for m in TABLE_REGEX.finditer(content)]
-
-    dataframes: List[pd.DataFrame] = []
-    for table_md in tables_md:
-        cleaned_table = "\n".join(
-            line for line in table_md.splitlines()
-            if not SEPARATOR_LINE_REGEX.match(line)
-        ).strip()
-        if not cleaned_table:
-            continue
-        try:
-            df = pd.read_csv(StringIO(cleaned_table), sep="|", engine="python")
-            df = df.dropna(axis=1, how="all")
-            df.columns = df.columns.str.strip()
-            df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
-            dataframes.append(df)
-        except Exception as e:  # noqa: BLE001
-            logger.warning(f"Failed to parse a table chunk: {e}")
-            continue
+    dataframes = list(iter_tables(md_file_path))
     logger.info(f"Extracted {len(dataframes)} tables from {md_file_path.name}")
     return dataframes
 
 
+def extract_tables_from_markdown(content: str, source_name: str = "markdown") -> List[pd.DataFrame]:
+    """Extract markdown tables from a string. Any table that fails to parse is skipped."""
+    dataframes = list(iter_tables_from_markdown(content))
+    logger.info(f"Extracted {len(dataframes)} tables from {source_name}")
+    return dataframes
+
+
+def _append_table(workbook, title: str, df: pd.DataFrame):
+    """Stream `df` into a new sheet of a write-only workbook, row by row."""
+    sheet = workbook.create_sheet(title=title)
+    sheet.append([str(column) for column in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None if pd.isna(value) else value for value in row])
+
+
+def save_tables_in_batches(
+    tables: Iterable[pd.DataFrame],
+    output_dir: Path,
+    sheets_per_file: int = 30,
+) -> Tuple[int, List[Path]]:
+    """Write tables into Excel files of `sheets_per_file` sheets as they arrive.
+
+    Workbooks are opened write-only, so rows go to disk as they are appended instead
+    of accumulating as cell objects. Each file is closed as soon as it is full, and
+    only the current table is held in memory when `tables` is a generator.
+    Returns (tables_written, created_excel_paths).
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sheets_per_file = max(1, sheets_per_file)
+    created: List[Path] = []
+    workbook = None
+    total = 0
+    try:
+        for df in tables:
+            if total % sheets_per_file == 0:
+                if workbook is not None:
+                    with span("excel_flush", file=created[-1].name):
+                        workbook.save(created[-1])
+                    workbook = None
+                    logger.info(f"Created Excel file: {created[-1]}")
+                created.append(output_dir / f"tables_{len(created) + 1}.xlsx")
+                workbook = Workbook(write_only=True)
+            total += 1
+            _append_table(workbook, f"Sheet_{total}", df)
+    finally:
+        if workbook is not None:
+            with span("excel_flush", file=created[-1].name):
+                workbook.save(created[-1])
+    if created:
+        logger.info(f"Created Excel file: {created[-1]}")
+    else:
+        logger.info("No tables to save; skipping Excel generation.")
+    return total, created
+
+
 def save_dfs_in_batches(
     dfs: List[pd.DataFrame],
     md_file_path: Path,
@@ -56,48 +156,60 @@ def save_dfs_in_batches(
     Files are written into `output_dir` which is created if absent.
     Returns list of created Excel file paths.
     """
-    output_dir.mkdir(parents=True, exist_ok=True)
-    created: List[Path] = []
-    total = len(dfs)
-    if total == 0:
-        logger.info("No tables to save; skipping Excel generation.")
-        return created
-
-    batches = math.ceil(total / sheets_per_file)
-    for batch_idx in range(batches):
-        excel_path = output_dir / f"tables_{batch_idx + 1}.xlsx"
-        with pd.ExcelWriter(excel_path, engine="openpyxl") as writer:  # type: ignore[arg-type]
-            for sheet_idx in range(sheets_per_file):
-                df_idx = batch_idx * sheets_per_file + sheet_idx
-                if df_idx >= total:
-                    break
-                dfs[df_idx].to_excel(writer, sheet_name=f"Sheet_{df_idx + 1}", index=False)
-        created.append(excel_path)
-        logger.info(f"Created Excel file: {excel_path}")
+    _, created = save_tables_in_batches(dfs, output_dir, sheets_per_file)
     return created
 
 
+def _iter_page_range_tables(pages: Iterable[Tuple[int, str]]) -> Iterator[pd.DataFrame]:
+    """Yield the tables of each page in turn."""
+    for _, markdown in pages:
+        yield from iter_tables_from_markdown(markdown)
+
+
 def extract_and_save_tables(
     document_name: str,
     outputs_dir: Path,
     sheets_per_file: int = 30,
     excel_base_dir: Path | None = None,
+    start_page: Optional[int] = None,
+    end_page: Optional[int] = None,
 ):
     """High-level helper to extract tables for a processed document and save them.
 
     Marker output markdown expected at: outputs_dir / document_name / document_name.md
+    If start_page/end_page are given, only those pages are read, from the document's
+    page store or per-page folders, instead of the combined markdown.
     If excel_base_dir provided, Excel files stored under excel_base_dir / document_name.
     Otherwise defaults to outputs_dir / document_name / tables_xlsx_<document_name>.
-    Returns tuple (markdown_path, tables_list, excel_files_list, excel_folder_path)
+    Tables are streamed from the markdown straight into the Excel batches.
+    Returns tuple (markdown_path, tables_count, excel_files_list, excel_folder_path)
     """
-    md_path = outputs_dir / document_name / f"{document_name}.md"
-    if not md_path.exists():
-        raise FileNotFoundError(f"Processed markdown not found for document '{document_name}': {md_path}")
-
-    dfs = extract_tables_as_dataframes(md_path)
+    doc_dir = outputs_dir / document_name
     if excel_base_dir:
         excel_folder = excel_base_dir / document_name
     else:
         excel_folder = outputs_dir / document_name / f"tables_xlsx_{document_name}"
-    excel_files = save_dfs_in_batches(dfs, md_path, excel_folder, sheets_per_file)
-    return md_path, dfs, excel_files, excel_folder
+
+    if start_page is not None or end_page is not None:
+        store = page_store_path(doc_dir, document_name)
+        md_path = store if store.exists() else doc_dir
+        pages = iter_page_range(doc_dir, document_name, start_page or 1, end_page)
+        first = next(pages, None)
+        if first is None:
+            raise FileNotFoundError(
+                f"No processed pages {start_page or 1}-{end_page or 'end'} found for document '{document_name}'"
+            )
+        tables = _iter_page_range_tables(itertools.chain([first], pages))
+        source_name = f"{document_name} pages {start_page or 1}-{end_page or 'end'}"
+    else:
+        md_path = doc_dir / f"{document_name}.md"
+        if not md_path.exists():
+            raise FileNotFoundError(f"Processed markdown not found for document '{document_name}': {md_path}")
+        tables = iter_tables(md_path)
+        source_name = md_path.name
+
+    tables_count, excel_files = save_tables_in_batches(tables, excel_folder, sheets_per_file)
+    metrics.inc("tables.extracted", tables_count)
+    metrics.inc("tables.excel_files", len(excel_files))
+    logger.info(f"Extracted {tables_count} tables from {source_name}")
+    return md_path, tables_count, excel_files, excel_folder
@@ -1,11 +1,44 @@
 from pathlib import Path
+import os
 import shutil
 
 def clean_dir(path: Path, keep: int = 0):
     """Remove files in a directory. If keep > 0, keep newest `keep` files by mtime."""
     files = sorted(path.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True)
     for f in files[keep:]:
-        if f.is_file():
-            f.unlink()
-        elif f.is_dir():
-            shutil.rmtree(f)
+        remove_path(f)
+
+
+def remove_path(path: Path):
+    """Remove a file or a whole directory tree."""
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+
+
+def path_size(path: Path) -> int:
+    """Return size in bytes of a file, or of all files below a directory."""
+    if not path.is_dir() or path.is_symlink():
+        return path.lstat().st_size
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def newest_mtime(path: Path) -> float:
+    """Return the newest mtime of a path and, for directories, everything below it."""
+    newest = path.lstat().st_mtime
+    if path.is_dir() and not path.is_symlink():
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    newest = max(newest, os.lstat(os.path.join(root, name)).st_mtime)
+                except OSError:
+                    continue
+    return newest